@@ -8,8 +8,6 @@ import sys
 import signal
 import threading
 import time
-import traceback
-import warnings
 
 try:
     import asyncio
@@ -34,6 +32,13 @@ taskManager = None
 deferredFns = []
 sleeptime = 0.0
 
+# set when deferred() has triggered the task manager since the last drain
+_trigger_pending = False
+
+# not all platforms have all signals
+_has_sigterm = hasattr(signal, 'SIGTERM')
+_has_sigusr1 = hasattr(signal, 'SIGUSR1')
+
 #
 #   stop
 #
@@ -63,6 +68,8 @@ def stop(*args):
 @bacpypes_debugging
 def dump_stack(debug_handler):
     if _debug: dump_stack._debug("dump_stack %r", debug_handler)
+    import traceback
+
     for filename, lineno, fn, _ in traceback.extract_stack()[:-1]:
         debug_handler("    %-20s  %s:%s", fn, filename.split('/')[-1], lineno)
 
@@ -70,36 +77,35 @@ def dump_stack(debug_handler):
 #   print_stack
 #
 
+# maximum number of frames to dump
+STACK_LIMIT = 64
+
 @bacpypes_debugging
 def print_stack(sig, frame):
     """Signal handler to print a stack trace and some interesting values."""
     if _debug: print_stack._debug("print_stack %r %r", sig, frame)
     global running, deferredFns, sleeptime
-
-    sys.stderr.write("==== USR1 Signal, %s\n" % time.strftime("%d-%b-%Y %H:%M:%S"))
-
-    sys.stderr.write("---------- globals\n")
-    sys.stderr.write("    running: %r\n" % (running,))
-    sys.stderr.write("    deferredFns: %r\n" % (deferredFns,))
-    sys.stderr.write("    sleeptime: %r\n" % (sleeptime,))
-
-    sys.stderr.write("---------- stack\n")
-    traceback.print_stack(frame)
-
-    # make a list of interesting frames
-    flist = []
-    f = frame
-    while f.f_back:
-        flist.append(f)
-        f = f.f_back
-
-    # reverse the list so it is in the same order as print_stack
-    flist.reverse()
-    for f in flist:
-        sys.stderr.write("---------- frame: %s\n" % (f,))
-        for k, v in f.f_locals.items():
-            sys.stderr.write("    %s: %r\n" % (k, v))
-
+    import traceback
+
+    lines = [
+        "==== USR1 Signal, %s\n" % time.strftime("%d-%b-%Y %H:%M:%S"),
+        "---------- globals\n",
+        "    running: %r\n" % (running,),
+        "    deferredFns: %r\n" % (deferredFns,),
+        "    sleeptime: %r\n" % (sleeptime,),
+        "---------- stack\n",
+        ]
+
+    # walk the stack once, capturing the locals of the innermost frames,
+    # and put it in the same order as print_stack
+    summary = traceback.StackSummary.extract(
+        traceback.walk_stack(frame), limit=STACK_LIMIT, capture_locals=True,
+        )
+    summary.reverse()
+    lines.extend(traceback.StackSummary.from_list(summary).format())
+
+    # one write for the whole thing
+    sys.stderr.write(''.join(lines))
     sys.stderr.flush()
 
 #
@@ -107,19 +113,21 @@ def print_stack(sig, frame):
 #
 
 SPIN = 1.0
+DEFERRED_DELTA = 0.001
 
 @bacpypes_debugging
 def run(spin=SPIN, sigterm=stop, sigusr1=print_stack):
     if _debug: run._debug("run spin=%r sigterm=%r, sigusr1=%r", spin, sigterm, sigusr1)
-    global running, taskManager, deferredFns, sleeptime
+    global running, taskManager, deferredFns, sleeptime, _trigger_pending
 
     # install the signal handlers if they have been provided (issue #112)
-    if isinstance(threading.current_thread(), threading._MainThread):
-        if (sigterm is not None) and hasattr(signal, 'SIGTERM'):
+    if threading.current_thread() is threading.main_thread():
+        if (sigterm is not None) and _has_sigterm:
             signal.signal(signal.SIGTERM, sigterm)
-        if (sigusr1 is not None) and hasattr(signal, 'SIGUSR1'):
+        if (sigusr1 is not None) and _has_sigusr1:
             signal.signal(signal.SIGUSR1, sigusr1)
     elif sigterm or sigusr1:
+        import warnings
         warnings.warn("no signal handlers for child threads")
 
     # reference the task manager (a singleton)
@@ -151,12 +159,12 @@ def run(spin=SPIN, sigterm=stop, sigusr1=print_stack):
                 time.sleep(sleeptime)
                 delta -= sleeptime
 
-            # delta should be no more than the spin value
-            delta = min(delta, spin)
-
-            # if there are deferred functions, use a small delta
-            if deferredFns:
-                delta = min(delta, 0.001)
+            # delta should be no more than the spin value, or a small delta
+            # if there are deferred functions
+            if delta > spin:
+                delta = spin
+            if deferredFns and (delta > DEFERRED_DELTA):
+                delta = DEFERRED_DELTA
 #           if _debug: run._debug("    - delta: %r", delta)
 
             # loop for socket activity or sleep for the delta
@@ -172,11 +180,15 @@ def run(spin=SPIN, sigterm=stop, sigusr1=print_stack):
                 # get a reference to the list
                 fnlist = deferredFns
                 deferredFns = []
+                _trigger_pending = False
 
                 # call the functions
                 for fn, args, kwargs in fnlist:
 #                   if _debug: run._debug("    - call: %r %r %r", fn, args, kwargs)
-                    fn(*args, **kwargs)
+                    if kwargs:
+                        fn(*args, **kwargs)
+                    else:
+                        fn(*args)
 
                 # done with this list
                 del fnlist
@@ -201,7 +213,7 @@ def run_once():
     socket IO actviity) and the timers.
     """
     if _debug: run_once._debug("run_once")
-    global taskManager, deferredFns
+    global taskManager, deferredFns, _trigger_pending
 
     # reference the task manager (a singleton)
     taskManager = TaskManager()
@@ -222,11 +234,15 @@ def run_once():
                 # get a reference to the list
                 fnlist = deferredFns
                 deferredFns = []
+                _trigger_pending = False
 
                 # call the functions
                 for fn, args, kwargs in fnlist:
                     if _debug: run_once._debug("    - call: %r %r %r", fn, args, kwargs)
-                    fn(*args, **kwargs)
+                    if kwargs:
+                        fn(*args, **kwargs)
+                    else:
+                        fn(*args)
 
                 # done with this list
                 del fnlist
@@ -243,13 +259,14 @@ def run_once():
 @bacpypes_debugging
 def deferred(fn, *args, **kwargs):
     if _debug: deferred._debug("deferred %r %r %r", fn, args, kwargs)
-    global deferredFns, taskManager
+    global deferredFns, taskManager, _trigger_pending
 
     # append it to the list
     deferredFns.append((fn, args, kwargs))
 
-    # trigger the task manager event
-    if taskManager and taskManager.trigger:
+    # trigger the task manager event, once until the list is drained
+    if (not _trigger_pending) and taskManager and taskManager.trigger:
+        _trigger_pending = True
         if _debug: deferred._debug("    - trigger")
         taskManager.trigger.set()
 
@@ -88,6 +88,9 @@ _log = ModuleLogger(globals())
 
 class DebugContents(object):
 
+    # no instance data, so derived classes can use __slots__
+    __slots__ = ()
+
     def debug_contents(self, indent=1, file=sys.stdout, _ids=None):
         """Debug the contents of an object."""
         if _debug: _log.debug("debug_contents indent=%r file=%r _ids=%r", indent, file, _ids)
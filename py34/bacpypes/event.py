@@ -4,7 +4,15 @@
 Event
 """
 
+import os
+import weakref
 import asyncio
+import threading
+
+try:
+    import asyncore
+except ImportError:  # pragma: no cover
+    asyncore = None
 
 from .debugging import Logging, bacpypes_debugging, ModuleLogger
 
@@ -12,6 +20,58 @@ from .debugging import Logging, bacpypes_debugging, ModuleLogger
 _debug = 0
 _log = ModuleLogger(globals())
 
+#
+#   _get_event_loop
+#
+#   The asyncio event loop for events that are not given one, it is looked
+#   up once rather than by each event.
+#
+
+_event_loop = None
+
+def _get_event_loop():
+    global _event_loop
+
+    if _event_loop is None:
+        _event_loop = asyncio.get_event_loop()
+    return _event_loop
+
+#
+#   _event_handle_read
+#
+#   The reader callback of an event in an asyncio loop, the loop only has
+#   a weak reference so it does not keep the event alive.
+#
+
+def _event_handle_read(eventRef):
+    event = eventRef()
+    if event is not None:
+        event.handle_read()
+
+#
+#   _EventDispatcher
+#
+#   Watches the read end of the pipe of an event in the asyncore.loop() that
+#   core.run() uses when asyncore is available.
+#
+
+if asyncore:
+    class _EventDispatcher(asyncore.file_dispatcher):
+
+        def __init__(self, event):
+            asyncore.file_dispatcher.__init__(self, event.fileno())
+
+            # the event closes this when it goes away
+            self.eventRef = weakref.ref(event)
+
+        def writable(self):
+            return False
+
+        def handle_read(self):
+            event = self.eventRef()
+            if event is not None:
+                event.handle_read()
+
 #
 #   WaitableEvent
 #
@@ -25,27 +85,73 @@ class WaitableEvent(Logging):
     def __init__(self, loop=None):
         if _debug:
             WaitableEvent._debug("__init__ loop=%r", loop)
-        self._loop = loop or asyncio.get_event_loop()
-        self._event = asyncio.Event()
+        self._loop = loop
+        self._event = threading.Event()
+
+        # self-pipe, the read end becomes readable when the event is set
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+
+        # wake up the event loop when the event is set, when one isn't
+        # given use the same one core.run() does
+        self._dispatcher = None
+        if not self._loop:
+            if asyncore:
+                self._dispatcher = _EventDispatcher(self)
+            else:
+                self._loop = _get_event_loop()
+        if self._loop:
+            self._loop.add_reader(self._read_fd, _event_handle_read, weakref.ref(self))
 
     def __del__(self):
         if _debug:
             WaitableEvent._debug("__del__")
+        self.close()
+
+    def close(self):
+        """Stop watching the pipe and close it, the event is not usable
+        after this."""
+        if _debug:
+            WaitableEvent._debug("close")
+
+        # only once
+        if self._read_fd is None:
+            return
+
+        if self._dispatcher is not None:
+            self._dispatcher.close()
+            self._dispatcher = None
+        if self._loop:
+            try:
+                self._loop.remove_reader(self._read_fd)
+            except Exception:
+                pass
+
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+        self._read_fd = self._write_fd = None
 
     #----- file methods
 
-    # asyncio based event does not expose file descriptor handlers
+    def fileno(self):
+        return self._read_fd
+
+    def handle_read(self):
+        """Drain the pipe, the state of the event is unchanged."""
+        self._drain()
+
+    def _drain(self):
+        try:
+            while os.read(self._read_fd, 1024):
+                pass
+        except BlockingIOError:
+            pass
 
     #----- event methods
 
     def wait(self, timeout=None):
-        try:
-            self._loop.run_until_complete(
-                asyncio.wait_for(self._event.wait(), timeout)
-            )
-            return True
-        except asyncio.TimeoutError:
-            return False
+        return self._event.wait(timeout)
 
     def is_set(self):
         return self._event.is_set()
@@ -53,9 +159,19 @@ class WaitableEvent(Logging):
     def set(self):
         if _debug:
             WaitableEvent._debug("set")
-        self._event.set()
+
+        # only the first set writes to the pipe
+        if not self._event.is_set():
+            self._event.set()
+            try:
+                os.write(self._write_fd, b'1')
+            except BlockingIOError:
+                pass
 
     def clear(self):
         if _debug:
             WaitableEvent._debug("clear")
+        # drain the pipe before clearing the event, so a set() from another
+        # thread can never leave the event set with an empty pipe
+        self._drain()
         self._event.clear()
@@ -4,17 +4,18 @@
 IOCB Module
 """
 
-import sys
 import logging
 from time import time as _time
 
+import types
 import threading
-from bisect import bisect_left
+import itertools
+from heapq import heappush, heappop
 
 from .debugging import bacpypes_debugging, ModuleLogger, DebugContents
 
 from .core import deferred
-from .task import FunctionTask
+from .task import OneShotDeleteTask, FunctionTask
 from .comm import Client
 
 # some debugging
@@ -22,8 +23,11 @@ _debug = 0
 _log = ModuleLogger(globals())
 _statelog = logging.getLogger(__name__ + "._statelog")
 
-# globals
-local_controllers = {}
+# globals, the local controllers are changed under the lock and published
+# as a read-only view of the same dictionary
+_local_controllers = {}
+_local_controllers_lock = threading.Lock()
+local_controllers = types.MappingProxyType(_local_controllers)
 
 #
 #   IOCB States
@@ -61,14 +65,101 @@ _ctrlStateNames = {
 TimeoutError = RuntimeError("timeout")
 
 # current time formatting (short version)
-_strftime = lambda: "%011.6f" % (_time() % 3600,)
+_strftime = lambda: "%011.6f" % (_time() % 3600.0)
+
+#
+#   _Timestamp
+#
+#   Passed as a logging argument in place of _strftime() so the time is
+#   only formatted when the record is actually emitted.
+#
+
+class _Timestamp:
+
+    __slots__ = ()
+
+    def __str__(self):
+        return _strftime()
+
+_timestamp = _Timestamp()
+
+#
+#   CompletionEvent
+#
+#   The completion event of an IOCB is checked and set far more often
+#   than anything waits on it, so the flag is a plain attribute and a
+#   threading.Event is only created when a thread has to block.
+#
+
+_completionLock = threading.Lock()
+
+class CompletionEvent:
+
+    __slots__ = ('_flag', '_event')
+
+    def __init__(self):
+        self._flag = False
+        self._event = None
+
+    def is_set(self):
+        return self._flag
+
+    isSet = is_set
+
+    def set(self):
+        self._flag = True
+
+        # wake up anything waiting
+        event = self._event
+        if event is not None:
+            event.set()
+
+    def clear(self):
+        self._flag = False
+
+        event = self._event
+        if event is not None:
+            event.clear()
+
+    def wait(self, timeout=None):
+        if self._flag:
+            return True
+
+        # create the real event, only one thread gets to make it
+        with _completionLock:
+            if self._event is None:
+                self._event = threading.Event()
+            event = self._event
+
+        # check again in case it was set before the event existed
+        if self._flag:
+            return True
+
+        return event.wait(timeout)
+
+#
+#   _IOCBTimeout
+#
+#   The transaction timer of an IOCB, it is kept by the IOCB and
+#   rescheduled when the timeout is changed rather than replaced.
+#
+
+class _IOCBTimeout(OneShotDeleteTask):
+
+    def __init__(self, iocb, err):
+        OneShotDeleteTask.__init__(self)
+        self.iocb = iocb
+        self.err = err
+
+    def process_task(self):
+        self.iocb.abort(self.err)
 
 #
 #   IOCB - Input Output Control Block
 #
 
-_identNext = 1
-_identLock = threading.Lock()
+# unique identity for each block, the C level counter does not need a lock
+_identNext = itertools.count(1).__next__
 
 @bacpypes_debugging
 class IOCB(DebugContents):
@@ -81,17 +172,8 @@ class IOCB(DebugContents):
         )
 
     def __init__(self, *args, **kwargs):
-        global _identNext
-
-        # lock the identity sequence number
-        _identLock.acquire()
-
         # generate a unique identity for this block
-        ioID = _identNext
-        _identNext += 1
-
-        # release the lock
-        _identLock.release()
+        ioID = _identNext()
 
         # debugging postponed until ID acquired
         if _debug: IOCB._debug("__init__(%d) %r %r", ioID, args, kwargs)
@@ -112,14 +194,15 @@ class IOCB(DebugContents):
         self.ioController = None
 
         # each block gets a completion event
-        self.ioComplete = threading.Event()
-        self.ioComplete.clear()
+        self.ioComplete = CompletionEvent()
 
-        # applications can set a callback functions
-        self.ioCallback = []
+        # applications can set a callback functions, a single callback
+        # without arguments is kept as it is, otherwise a list
+        self.ioCallback = None
 
         # request is not currently queued
         self.ioQueue = None
+        self.ioQueueEntry = None
 
         # extract the priority if it was given
         self.ioPriority = kwargs.get('_priority', 0)
@@ -135,7 +218,15 @@ class IOCB(DebugContents):
         if _debug: IOCB._debug("add_callback(%d) %r %r %r", self.ioID, fn, args, kwargs)
 
         # store it
-        self.ioCallback.append((fn, args, kwargs))
+        ioCallback = self.ioCallback
+        if isinstance(ioCallback, list):
+            ioCallback.append((fn, args, kwargs))
+        elif ioCallback is not None:
+            self.ioCallback = [(ioCallback, (), {}), (fn, args, kwargs)]
+        elif args or kwargs:
+            self.ioCallback = [(fn, args, kwargs)]
+        else:
+            self.ioCallback = fn
 
         # already complete?
         if self.ioComplete.is_set():
@@ -167,9 +258,16 @@ class IOCB(DebugContents):
         if _debug: IOCB._debug("    - complete event set")
 
         # make the callback(s)
-        for fn, args, kwargs in self.ioCallback:
-            if _debug: IOCB._debug("    - callback fn: %r %r %r", fn, args, kwargs)
-            fn(self, *args, **kwargs)
+        ioCallback = self.ioCallback
+        if ioCallback is None:
+            pass
+        elif isinstance(ioCallback, list):
+            for fn, args, kwargs in ioCallback:
+                if _debug: IOCB._debug("    - callback fn: %r %r %r", fn, args, kwargs)
+                fn(self, *args, **kwargs)
+        else:
+            if _debug: IOCB._debug("    - callback fn: %r", ioCallback)
+            ioCallback(self)
 
     def complete(self, msg):
         """Called to complete a transaction, usually when ProcessIO has
@@ -202,14 +300,16 @@ class IOCB(DebugContents):
         """Called to set a transaction timer."""
         if _debug: IOCB._debug("set_timeout(%d) %r err=%r", self.ioID, delay, err)
 
-        # if one has already been created, cancel it
-        if self.ioTimeout:
-            self.ioTimeout.suspend_task()
+        # reuse the timer if one has already been created, installing
+        # it again takes it out of the schedule
+        ioTimeout = self.ioTimeout
+        if ioTimeout:
+            ioTimeout.err = err
         else:
-            self.ioTimeout = FunctionTask(self.abort, err)
+            ioTimeout = self.ioTimeout = _IOCBTimeout(self, err)
 
         # (re)schedule it
-        self.ioTimeout.install_task(delta=delay)
+        ioTimeout.install_task(delta=delay)
 
     def __repr__(self):
         xid = id(self)
@@ -255,9 +355,8 @@ class IOChainMixIn(DebugContents):
             self.encode()
 
             if _debug: IOChainMixIn._debug("    - encode complete")
-        except:
-            # extract the error and abort the request
-            err = sys.exc_info()[1]
+        except Exception as err:
+            # abort the request
             if _debug: IOChainMixIn._exception("    - encoding exception: %r", err)
 
             iocb.abort(err)
@@ -280,9 +379,8 @@ class IOChainMixIn(DebugContents):
             self.decode()
 
             if _debug: IOChainMixIn._debug("    - decode complete")
-        except:
-            # extract the error and abort
-            err = sys.exc_info()[1]
+        except Exception as err:
+            # abort the chained request
             if _debug: IOChainMixIn._exception("    - decoding exception: %r", err)
 
             iocb.ioState = ABORTED
@@ -371,8 +469,9 @@ class IOGroup(IOCB, DebugContents):
         if _debug: IOGroup._debug("__init__")
         IOCB.__init__(self)
 
-        # start with an empty list of members
+        # start with an empty list of members, none of them outstanding
         self.ioMembers = []
+        self.ioOutstanding = set()
 
         # start out being done.  When an IOCB is added to the
         # group that is not already completed, this state will
@@ -384,8 +483,9 @@ class IOGroup(IOCB, DebugContents):
         """Add an IOCB to the group, you can also add other groups."""
         if _debug: IOGroup._debug("add %r", iocb)
 
-        # add this to our members
+        # add this to our members, it is outstanding until its callback
         self.ioMembers.append(iocb)
+        self.ioOutstanding.add(iocb)
 
         # assume all of our members have not completed yet
         self.ioState = PENDING
@@ -399,11 +499,17 @@ class IOGroup(IOCB, DebugContents):
         """Callback when a child iocb completes."""
         if _debug: IOGroup._debug("group_callback %r", iocb)
 
-        # check all the members
-        for iocb in self.ioMembers:
-            if not iocb.ioComplete.is_set():
-                if _debug: IOGroup._debug("    - waiting for child: %r", iocb)
-                break
+        # a member calls back again when another callback is added to it
+        # after it has completed, it only counts the first time
+        ioOutstanding = self.ioOutstanding
+        if iocb not in ioOutstanding:
+            if _debug: IOGroup._debug("    - already complete")
+            return
+
+        # one less to wait for
+        ioOutstanding.remove(iocb)
+        if ioOutstanding:
+            if _debug: IOGroup._debug("    - waiting for %d children", len(ioOutstanding))
         else:
             if _debug: IOGroup._debug("    - all children complete")
             # everything complete
@@ -438,9 +544,14 @@ class IOQueue:
         if _debug: IOQueue._debug("__init__ %r", name)
 
         self.notempty = threading.Event()
-        self.notempty.clear()
 
+        # heap of [priority, sequence, iocb], the sequence number keeps
+        # requests at the same priority in order and the iocb's are
+        # never compared, a removed request leaves its entry behind with
+        # the iocb replaced by None
         self.queue = []
+        self.count = 0
+        self.sequence = itertools.count()
 
     def put(self, iocb):
         """Add an IOCB to a queue.  This is usually called by the function
@@ -453,18 +564,21 @@ class IOQueue:
             raise RuntimeError("invalid state transition")
 
         # save that it might have been empty
-        wasempty = not self.notempty.is_set()
+        wasempty = not self.count
 
-        # add the request to the end of the list of iocb's at same priority
-        priority = iocb.ioPriority
-        item = (priority, iocb)
-        self.queue.insert(bisect_left(self.queue, (priority+1,)), item)
+        # add the request after the iocb's at the same priority
+        entry = [iocb.ioPriority, next(self.sequence), iocb]
+        heappush(self.queue, entry)
+        self.count += 1
 
-        # point the iocb back to this queue
+        # point the iocb back to this queue and its entry
         iocb.ioQueue = self
+        iocb.ioQueueEntry = entry
 
-        # set the event, queue is no longer empty
-        self.notempty.set()
+        # set the event when the queue is no longer empty, waiters only
+        # need to hear about the transition
+        if wasempty:
+            self.notempty.set()
 
         return wasempty
 
@@ -474,27 +588,29 @@ class IOQueue:
         if _debug: IOQueue._debug("get block=%r delay=%r", block, delay)
 
         # if the queue is empty and we do not block return None
-        if not block and not self.notempty.is_set():
+        if not block and not self.count:
             if _debug: IOQueue._debug("    - not blocking and empty")
             return None
 
         # wait for something to be in the queue
         if delay:
             self.notempty.wait(delay)
-            if not self.notempty.is_set():
+            if not self.count:
                 return None
         else:
             self.notempty.wait()
 
-        # extract the first element
-        priority, iocb = self.queue[0]
-        del self.queue[0]
-        iocb.ioQueue = None
+        # extract the first element, skipping the ones that were removed
+        while True:
+            priority, sequence, iocb = heappop(self.queue)
+            if iocb is not None:
+                break
+        iocb.ioQueue = iocb.ioQueueEntry = None
+        self.count -= 1
 
         # if the queue is empty, clear the event
-        qlen = len(self.queue)
-        if not qlen:
-            self.notempty.clear()
+        if not self.count:
+            self._empty()
 
         # return the request
         return iocb
@@ -504,40 +620,39 @@ class IOQueue:
         is canceled/aborted."""
         if _debug: IOQueue._debug("remove %r", iocb)
 
-        # remove the request from the queue
-        for i, item in enumerate(self.queue):
-            if iocb is item[1]:
-                if _debug: IOQueue._debug("    - found at %d", i)
-                del self.queue[i]
+        if iocb.ioQueue is not self:
+            if _debug: IOQueue._debug("    - not found")
+            return
 
-                # if the queue is empty, clear the event
-                qlen = len(self.queue)
-                if not qlen:
-                    self.notempty.clear()
+        # leave the entry in the heap without the iocb, get() will skip
+        # over it
+        iocb.ioQueueEntry[2] = None
+        iocb.ioQueue = iocb.ioQueueEntry = None
+        self.count -= 1
 
-                # record the new length
-                # self.queuesize.Record( qlen, _time() )
-                break
-        else:
-            if _debug: IOQueue._debug("    - not found")
+        # if the queue is empty, clear the event
+        if not self.count:
+            self._empty()
 
     def abort(self, err):
         """Abort all of the control blocks in the queue."""
         if _debug: IOQueue._debug("abort %r", err)
 
-        # send aborts to all of the members
-        try:
-            for iocb in self.queue:
-                iocb.ioQueue = None
-                iocb.abort(err)
+        # take the contents, the queue is now empty
+        queue = self.queue
+        self._empty()
 
-            # flush the queue
-            self.queue = []
+        # send aborts to all of the members in order
+        for priority, sequence, iocb in sorted(queue):
+            if iocb is not None:
+                iocb.ioQueue = iocb.ioQueueEntry = None
+                iocb.abort(err)
 
-            # the queue is now empty, clear the event
-            self.notempty.clear()
-        except ValueError:
-            pass
+    def _empty(self):
+        """Forget the removed entries and clear the event."""
+        self.queue = []
+        self.count = 0
+        self.notempty.clear()
 
 #
 #   IOController
@@ -569,20 +684,13 @@ class IOController(object):
         iocb.ioController = self
 
         try:
-            # hopefully there won't be an error
-            err = None
-
             # change the state
             iocb.ioState = PENDING
 
             # let derived class figure out how to process this
             self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
-
-        # if there was an error, abort the request
-        if err:
+        except Exception as err:
+            # there was an error, abort the request
             self.abort_io(iocb, err)
 
     def process_io(self, iocb):
@@ -606,12 +714,9 @@ class IOController(object):
         """Called by a handler to return data to the client."""
         if _debug: IOController._debug("complete_io %r %r", iocb, msg)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
-            pass
-
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
         else:
@@ -626,12 +731,9 @@ class IOController(object):
         """Called by a handler or a client to abort a transaction."""
         if _debug: IOController._debug("abort_io %r %r", iocb, err)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
-            pass
-
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
         else:
@@ -658,7 +760,7 @@ class IOQController(IOController):
 
         # start idle
         self.state = CTRL_IDLE
-        _statelog.debug("%s %s %s" % (_strftime(), self.name, "idle"))
+        _statelog.debug("%s %s %s", _timestamp, self.name, "idle")
 
         # no active iocb
         self.active_iocb = None
@@ -706,18 +808,11 @@ class IOQController(IOController):
             return
 
         try:
-            # hopefully there won't be an error
-            err = None
-
             # let derived class figure out how to process this
             self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
+        except Exception as err:
             if _debug: IOQController._debug("    - process_io() exception: %r", err)
-
-        # if there was an error, abort the request
-        if err:
+            # there was an error, abort the request
             if _debug: IOQController._debug("    - aborting")
             self.abort_io(iocb, err)
 
@@ -736,7 +831,7 @@ class IOQController(IOController):
 
         # change our state
         self.state = CTRL_ACTIVE
-        _statelog.debug("%s %s %s" % (_strftime(), self.name, "active"))
+        _statelog.debug("%s %s %s", _timestamp, self.name, "active")
 
         # keep track of the iocb
         self.active_iocb = iocb
@@ -759,7 +854,7 @@ class IOQController(IOController):
         if self.wait_time:
             # change our state
             self.state = CTRL_WAITING
-            _statelog.debug("%s %s %s" % (_strftime(), self.name, "waiting"))
+            _statelog.debug("%s %s %s", _timestamp, self.name, "waiting")
 
             # schedule a call in the future
             task = FunctionTask(IOQController._wait_trigger, self)
@@ -768,7 +863,7 @@ class IOQController(IOController):
         else:
             # change our state
             self.state = CTRL_IDLE
-            _statelog.debug("%s %s %s" % (_strftime(), self.name, "idle"))
+            _statelog.debug("%s %s %s", _timestamp, self.name, "idle")
 
             # look for more to do
             deferred(IOQController._trigger, self)
@@ -790,7 +885,7 @@ class IOQController(IOController):
 
         # change our state
         self.state = CTRL_IDLE
-        _statelog.debug("%s %s %s" % (_strftime(), self.name, "idle"))
+        _statelog.debug("%s %s %s", _timestamp, self.name, "idle")
 
         # look for more to do
         deferred(IOQController._trigger, self)
@@ -799,36 +894,26 @@ class IOQController(IOController):
         """Called to launch the next request in the queue."""
         if _debug: IOQController._debug("_trigger")
 
-        # if we are busy, do nothing
-        if self.state != CTRL_IDLE:
-            if _debug: IOQController._debug("    - not idle")
-            return
-
-        # if there is nothing to do, return
-        if not self.ioQueue.queue:
-            if _debug: IOQController._debug("    - empty queue")
-            return
-
-        # get the next iocb
-        iocb = self.ioQueue.get()
-
-        try:
-            # hopefully there won't be an error
-            err = None
-
-            # let derived class figure out how to process this
-            self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
+        # keep going while we are idle and there is something to do,
+        # requests that complete right away do not need another pass
+        # through the core loop
+        while (self.state == CTRL_IDLE) and self.ioQueue.queue:
+            # get the next iocb
+            iocb = self.ioQueue.get()
+            if _debug: IOQController._debug("    - iocb: %r", iocb)
 
-        # if there was an error, abort the request
-        if err:
-            self.abort_io(iocb, err)
+            try:
+                # let derived class figure out how to process this
+                self.process_io(iocb)
+            except Exception as err:
+                # there was an error, abort the request
+                self.abort_io(iocb, err)
 
-        # if we're idle, call again
-        if self.state == CTRL_IDLE:
-            deferred(IOQController._trigger, self)
+        if _debug:
+            if self.state != CTRL_IDLE:
+                IOQController._debug("    - not idle")
+            else:
+                IOQController._debug("    - empty queue")
 
     def _wait_trigger(self):
         """Called to launch the next request in the queue."""
@@ -840,7 +925,7 @@ class IOQController(IOController):
 
         # change our state
         self.state = CTRL_IDLE
-        _statelog.debug("%s %s %s" % (_strftime(), self.name, "idle"))
+        _statelog.debug("%s %s %s", _timestamp, self.name, "idle")
 
         # look for more to do
         IOQController._trigger(self)
@@ -985,17 +1070,17 @@ class SieveClientController(Client, IOController):
 @bacpypes_debugging
 def register_controller(controller):
     if _debug: register_controller._debug("register_controller %r", controller)
-    global local_controllers
 
     # skip those that shall not be named
     if not controller.name:
         return
 
-    # make sure there isn't one already
-    if controller.name in local_controllers:
-        raise RuntimeError("already a local controller named %r" % (controller.name,))
+    with _local_controllers_lock:
+        # make sure there isn't one already
+        if controller.name in _local_controllers:
+            raise RuntimeError("already a local controller named %r" % (controller.name,))
 
-    local_controllers[controller.name] = controller
+        _local_controllers[controller.name] = controller
 
 #
 #   abort
@@ -1005,8 +1090,11 @@ def register_controller(controller):
 def abort(err):
     """Abort everything, everywhere."""
     if _debug: abort._debug("abort %r", err)
-    global local_controllers
+
+    # work from a copy, a controller may be registered while aborting
+    with _local_controllers_lock:
+        controllers = list(_local_controllers.values())
 
     # tell all the local controllers to abort
-    for controller in local_controllers.values():
+    for controller in controllers:
         controller.abort(err)
@@ -37,9 +37,8 @@ if sys.platform in ('linux', 'darwin'):
         def handle_read(self):
             if _debug: _Trigger._debug("handle_read")
 
-            # read in the character, highlander
-            data = self.recv(1)
-            if _debug: _Trigger._debug("    - data: %r", data)
+            # drain the pipe and reset the event
+            self.clear()
 else:
     _Trigger = None
 
@@ -8,8 +8,9 @@ import asyncio
 import socket
 import pickle
 import queue
+from collections import deque
 
-from time import time as _time
+from time import time as _time, monotonic_ns as _now
 
 from .debugging import ModuleLogger, bacpypes_debugging
 
@@ -49,21 +50,34 @@ class UDPActor:
         else:
             self.timer = None
 
+        # traffic only updates this, the timer catches up when it fires,
+        # monotonic nanoseconds so clock changes do not matter
+        self.timeoutNS = int(self.timeout * 1e9)
+        self.lastActivity = _now()
+
         # tell the director this is a new actor
         self.director.add_actor(self)
 
     def idle_timeout(self):
         if _debug: UDPActor._debug("idle_timeout")
 
+        # if there has been traffic since the timer was installed, move
+        # the timer out rather than rescheduling it on every packet
+        remaining = self.lastActivity + self.timeoutNS - _now()
+        if remaining > 0:
+            if _debug: UDPActor._debug("    - still active")
+            self.timer.install_task(_time() + remaining / 1e9)
+            return
+
         # tell the director this is gone
         self.director.del_actor(self)
 
     def indication(self, pdu):
         if _debug: UDPActor._debug("indication %r", pdu)
 
-        # reschedule the timer
+        # push out the idle deadline
         if self.timer:
-            self.timer.install_task(_time() + self.timeout)
+            self.lastActivity = _now()
 
         # put it in the outbound queue for the director
         self.director.request.put(pdu)
@@ -71,9 +85,9 @@ class UDPActor:
     def response(self, pdu):
         if _debug: UDPActor._debug("response %r", pdu)
 
-        # reschedule the timer
+        # push out the idle deadline
         if self.timer:
-            self.timer.install_task(_time() + self.timeout)
+            self.lastActivity = _now()
 
         # process this as a response from the director
         self.director.response(pdu)
@@ -125,9 +139,10 @@ class UDPPickleActor(UDPActor):
 @bacpypes_debugging
 class UDPDirector(asyncio.DatagramProtocol, Server, ServiceAccessPoint):
 
-    def __init__(self, address, timeout=0, reuse=False, actorClass=UDPActor, sid=None, sapID=None, loop=None):
+    def __init__(self, address, timeout=0, reuse=False, actorClass=UDPActor, sid=None, sapID=None, loop=None, reuse_port=False):
         if _debug:
-            UDPDirector._debug("__init__ %r timeout=%r reuse=%r actorClass=%r sid=%r sapID=%r", address, timeout, reuse, actorClass, sid, sapID)
+            UDPDirector._debug("__init__ %r timeout=%r reuse=%r actorClass=%r sid=%r sapID=%r reuse_port=%r",
+                address, timeout, reuse, actorClass, sid, sapID, reuse_port)
         Server.__init__(self, sid)
         ServiceAccessPoint.__init__(self, sapID)
 
@@ -141,16 +156,35 @@ class UDPDirector(asyncio.DatagramProtocol, Server, ServiceAccessPoint):
         self.loop = loop or asyncio.get_event_loop()
         self.transport = None
 
-        listen = self.loop.create_datagram_endpoint(lambda: self, local_addr=address)
+        if reuse or reuse_port:
+            # socket options only matter if they are set before binding,
+            # the address family comes from the address like it does when
+            # asyncio creates the socket
+            family, socktype, proto, _, sockaddr = socket.getaddrinfo(*address, type=socket.SOCK_DGRAM)[0]
+            sock = socket.socket(family, socktype, proto)
+            if reuse:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                # lets several directors (usually in separate processes)
+                # bind the same port, the kernel spreads peers across them
+                if not hasattr(socket, 'SO_REUSEPORT'):
+                    sock.close()
+                    raise RuntimeError("SO_REUSEPORT not supported on this platform")
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(sockaddr)
+
+            listen = self.loop.create_datagram_endpoint(lambda: self, sock=sock)
+        else:
+            listen = self.loop.create_datagram_endpoint(lambda: self, local_addr=address)
         self.transport, _ = self.loop.run_until_complete(listen)
 
-        if reuse and hasattr(self.transport, 'getsockname'):
-            sock = self.transport.get_extra_info('socket')
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
         self.request = queue.Queue()
         self.peers = {}
 
+        # datagrams waiting to be passed up by the core loop
+        self.received = deque()
+        self.receivePending = False
+
     def add_actor(self, actor):
         """Add an actor when a new one is connected."""
         if _debug: UDPDirector._debug("add_actor %r", actor)
@@ -190,7 +224,12 @@ class UDPDirector(asyncio.DatagramProtocol, Server, ServiceAccessPoint):
         if _debug:
             UDPDirector._debug("datagram_received %r from %r", len(data), addr)
 
-        deferred(self._response, PDU(data, source=addr))
+        # one deferred call passes up everything that arrives before the
+        # core loop gets to it
+        self.received.append(PDU(data, source=addr))
+        if not self.receivePending:
+            self.receivePending = True
+            deferred(self._response_batch)
 
     def error_received(self, exc):
         if _debug:
@@ -226,12 +265,24 @@ class UDPDirector(asyncio.DatagramProtocol, Server, ServiceAccessPoint):
         if _debug: UDPDirector._debug("indication %r", pdu)
 
         addr = pdu.pduDestination
-        peer = self.peers.get(addr, None)
-        if not peer:
-            peer = self.actorClass(self, addr)
+        peer = self.peers.get(addr, None) or self.actorClass(self, addr)
         peer.indication(pdu)
-        if self.transport:
-            self.transport.sendto(pdu.pduData, addr)
+
+        transport = self.transport
+        if transport:
+            transport.sendto(pdu.pduData, addr)
+
+    def _response_batch(self):
+        """Pass up the datagrams received since the last call."""
+        if _debug: UDPDirector._debug("_response_batch")
+
+        # clear the flag first, anything that arrives while these are
+        # being processed schedules another call
+        self.receivePending = False
+
+        received = self.received
+        while received:
+            self._response(received.popleft())
 
     def _response(self, pdu):
         """Incoming datagrams are routed through an actor."""
@@ -4,22 +4,26 @@
 IO Module
 """
 
-import sys
+import os
 import logging
 
 from time import time as _time
 
+import types
+import struct
 import threading
-import cPickle
-from bisect import bisect_left
+import itertools
+import functools
+from heapq import heappush, heappop
 from collections import deque
+import pickle
 
 from bacpypes.debugging import bacpypes_debugging, DebugContents, ModuleLogger
 
 from bacpypes.core import deferred
 
 from bacpypes.comm import PDU, Client, bind
-from bacpypes.task import FunctionTask
+from bacpypes.task import OneShotDeleteTask, FunctionTask
 from bacpypes.udp import UDPDirector
 
 # some debugging
@@ -59,30 +63,211 @@ _ctrlStateNames = {
     CTRL_WAITING: 'WAITING',
     }
 
-# dictionary of local controllers
-_local_controllers = {}
+# dictionary of local controllers, it is replaced rather than changed so
+# it can be read without a lock
+_local_controllers = types.MappingProxyType({})
+_local_controllers_lock = threading.Lock()
+
+# shared proxy server, created when it is first needed
 _proxy_server = None
+_proxy_server_lock = threading.Lock()
 
 # special abort error
 TimeoutError = RuntimeError("timeout")
 
+#
+#   Message Encoding
+#
+#   Messages between an IOProxyServer and an IOServer start with a fixed
+#   header of a version, an opcode and the IOCB identifier, the remaining
+#   fields are pickled.  A single field that is None, like the completion
+#   of a request without a response, has no pickle at all.  When pickling
+#   hands over out-of-band buffers the message is version 2, the header
+#   is followed by the number of buffers and each buffer with its length,
+#   then the pickle.  A message that does not start with a version is a
+#   fully pickled tuple from an older peer.
+#
+#   When a server aborts everything it sends each client a bulk abort with
+#   a list of the client IOCB identifiers and the error, the identifier in
+#   the header is not used.
+#
+
+NEW_IOCB = 0
+COMPLETE_IOCB = 1
+ABORT_IOCB = 2
+BULK_ABORT_IOCB = 3
+
+# most identifiers in one bulk abort, keeps it well inside a datagram
+_bulkAbortLimit = 1000
+
+_messageVersion = 1
+_messageBuffersVersion = 2
+_messageHeader = struct.Struct('!BBQ')
+_messageCount = struct.Struct('!H')
+_messageLength = struct.Struct('!I')
+
+_pickleProtocol = 5
+
+# larger messages are unpickled from a view rather than a copy
+_copyLimit = 2048
+
+def _encode(opcode, iocbid, *fields):
+    """Return the message with its header and pickled fields."""
+    if (len(fields) == 1) and (fields[0] is None):
+        return _messageHeader.pack(_messageVersion, opcode, iocbid)
+
+    buffers = []
+    data = pickle.dumps(fields, _pickleProtocol, buffer_callback=buffers.append)
+    if not buffers:
+        return _messageHeader.pack(_messageVersion, opcode, iocbid) + data
+
+    # the buffers go ahead of the pickle so the pickle is the rest
+    parts = [
+        _messageHeader.pack(_messageBuffersVersion, opcode, iocbid),
+        _messageCount.pack(len(buffers)),
+        ]
+    for buffer in buffers:
+        buffer = buffer.raw()
+        parts.append(_messageLength.pack(buffer.nbytes))
+        parts.append(buffer)
+    parts.append(data)
+
+    return b''.join(parts)
+
+@functools.lru_cache(maxsize=256)
+def _encode_no_controller(controllerName):
+    """Return the error and the pickled fields of the abort for a request
+    to a controller that does not exist, they only depend on the name."""
+    err = RuntimeError("no local controller '%s'" % (controllerName, ))
+    return err, pickle.dumps((err,), _pickleProtocol)
+
+def _decode(data):
+    """Return the opcode, IOCB identifier, and the rest of the fields."""
+    version = data[0]
+    if version == _messageVersion:
+        version, opcode, iocbid = _messageHeader.unpack_from(data)
+        size = len(data)
+        if size == _messageHeader.size:
+            return opcode, iocbid, (None,)
+        if size > _copyLimit:
+            return opcode, iocbid, pickle.loads(memoryview(data)[_messageHeader.size:])
+        return opcode, iocbid, pickle.loads(data[_messageHeader.size:])
+
+    if version != _messageBuffersVersion:
+        message = pickle.loads(data)
+        return message[0], message[1], message[2:]
+
+    version, opcode, iocbid = _messageHeader.unpack_from(data)
+    offset = _messageHeader.size
+    count, = _messageCount.unpack_from(data, offset)
+    offset += _messageCount.size
+
+    # the buffers are slices of the message, they are not copied
+    view = memoryview(data)
+    buffers = []
+    for i in range(count):
+        length, = _messageLength.unpack_from(data, offset)
+        offset += _messageLength.size
+        buffers.append(view[offset:offset + length])
+        offset += length
+
+    return opcode, iocbid, pickle.loads(view[offset:], buffers=buffers)
+
 #
 #   _strftime
 #
 
 def _strftime():
-    return "%011.6f" % (_time() % 3600,)
+    return "%011.6f" % (_time() % 3600.0)
+
+#
+#   CompletionEvent
+#
+#   The completion event of an IOCB is checked and set far more often
+#   than anything waits on it, so the flag is a plain attribute and a
+#   threading.Event is only created when a thread has to block.
+#
+
+_completionLock = threading.Lock()
+
+class CompletionEvent:
+
+    __slots__ = ('_flag', '_event')
+
+    def __init__(self):
+        self._flag = False
+        self._event = None
+
+    def is_set(self):
+        return self._flag
+
+    isSet = is_set
+
+    def set(self):
+        self._flag = True
+
+        # wake up anything waiting
+        event = self._event
+        if event is not None:
+            event.set()
+
+    def clear(self):
+        self._flag = False
+
+        event = self._event
+        if event is not None:
+            event.clear()
+
+    def wait(self, timeout=None):
+        if self._flag:
+            return True
+
+        # create the real event, only one thread gets to make it
+        with _completionLock:
+            if self._event is None:
+                self._event = threading.Event()
+            event = self._event
+
+        # check again in case it was set before the event existed
+        if self._flag:
+            return True
+
+        return event.wait(timeout)
+
+#
+#   _IOCBTimeout
+#
+#   The transaction timer of an IOCB, it is kept by the IOCB and
+#   rescheduled when the timeout is changed rather than replaced.
+#
+
+class _IOCBTimeout(OneShotDeleteTask):
+
+    def __init__(self, iocb, err):
+        OneShotDeleteTask.__init__(self)
+        self.iocb = iocb
+        self.err = err
+
+    def process_task(self):
+        self.iocb.abort(self.err)
 
 #
 #   IOCB - Input Output Control Block
 #
 
-_identNext = 1
-_identLock = threading.Lock()
+# unique identity for each block, the C level counter does not need a lock
+_identNext = itertools.count(1).__next__
 
 @bacpypes_debugging
 class IOCB(DebugContents):
 
+    __slots__ = \
+        ( 'ioID', 'args', 'kwargs'
+        , 'ioState', 'ioResponse', 'ioError'
+        , 'ioController', 'ioServerRef', 'ioControllerRef', 'ioClientID', 'ioClientAddr'
+        , 'ioComplete', 'ioCallback', 'ioQueue', 'ioQueueEntry', 'ioPriority', 'ioTimeout'
+        )
+
     _debug_contents = \
         ( 'args', 'kwargs'
         , 'ioState', 'ioResponse-', 'ioError'
@@ -91,17 +276,8 @@ class IOCB(DebugContents):
         )
 
     def __init__(self, *args, **kwargs):
-        global _identNext
-
-        # lock the identity sequence number
-        _identLock.acquire()
-
         # generate a unique identity for this block
-        ioID = _identNext
-        _identNext += 1
-
-        # release the lock
-        _identLock.release()
+        ioID = _identNext()
 
         # debugging postponed until ID acquired
         if _debug: IOCB._debug("__init__(%d) %r %r", ioID, args, kwargs)
@@ -128,14 +304,15 @@ class IOCB(DebugContents):
         self.ioClientAddr = None
 
         # each block gets a completion event
-        self.ioComplete = threading.Event()
-        self.ioComplete.clear()
+        self.ioComplete = CompletionEvent()
 
-        # applications can set a callback functions
-        self.ioCallback = []
+        # applications can set a callback functions, a single callback
+        # without arguments is kept as it is, otherwise a list
+        self.ioCallback = None
 
         # request is not currently queued
         self.ioQueue = None
+        self.ioQueueEntry = None
 
         # extract the priority if it was given
         self.ioPriority = kwargs.get('_priority', 0)
@@ -151,7 +328,15 @@ class IOCB(DebugContents):
         if _debug: IOCB._debug("add_callback(%d) %r %r %r", self.ioID, fn, args, kwargs)
 
         # store it
-        self.ioCallback.append((fn, args, kwargs))
+        ioCallback = self.ioCallback
+        if isinstance(ioCallback, list):
+            ioCallback.append((fn, args, kwargs))
+        elif ioCallback is not None:
+            self.ioCallback = [(ioCallback, (), {}), (fn, args, kwargs)]
+        elif args or kwargs:
+            self.ioCallback = [(fn, args, kwargs)]
+        else:
+            self.ioCallback = fn
 
         # already complete?
         if self.ioComplete.isSet():
@@ -182,9 +367,16 @@ class IOCB(DebugContents):
         self.ioComplete.set()
 
         # make the callback
-        for fn, args, kwargs in self.ioCallback:
-            if _debug: IOCB._debug("    - callback fn: %r %r %r", fn, args, kwargs)
-            fn(self, *args, **kwargs)
+        ioCallback = self.ioCallback
+        if ioCallback is None:
+            pass
+        elif isinstance(ioCallback, list):
+            for fn, args, kwargs in ioCallback:
+                if _debug: IOCB._debug("    - callback fn: %r %r %r", fn, args, kwargs)
+                fn(self, *args, **kwargs)
+        else:
+            if _debug: IOCB._debug("    - callback fn: %r", ioCallback)
+            ioCallback(self)
 
     def complete(self, msg):
         """Called to complete a transaction, usually when process_io has
@@ -217,14 +409,16 @@ class IOCB(DebugContents):
         """Called to set a transaction timer."""
         if _debug: IOCB._debug("set_timeout(%d) %r err=%r", self.ioID, delay, err)
 
-        # if one has already been created, cancel it
-        if self.ioTimeout:
-            self.ioTimeout.suspend_task()
+        # reuse the timer if one has already been created, installing
+        # it again takes it out of the schedule
+        ioTimeout = self.ioTimeout
+        if ioTimeout:
+            ioTimeout.err = err
         else:
-            self.ioTimeout = FunctionTask(self.abort, err)
+            ioTimeout = self.ioTimeout = _IOCBTimeout(self, err)
 
         # (re)schedule it
-        self.ioTimeout.install_task(_time() + delay)
+        ioTimeout.install_task(_time() + delay)
 
     def __repr__(self):
         xid = id(self)
@@ -242,6 +436,10 @@ class IOCB(DebugContents):
 @bacpypes_debugging
 class IOChainMixIn(DebugContents):
 
+    # the ioChain slot is provided by the class it is mixed into, this
+    # keeps it from clashing with the IOCB layout
+    __slots__ = ()
+
     _debugContents = ( 'ioChain++', )
 
     def __init__(self, iocb):
@@ -270,9 +468,8 @@ class IOChainMixIn(DebugContents):
             self.Encode()
 
             if _debug: IOChainMixIn._debug("    - encode complete")
-        except:
-            # extract the error and abort the request
-            err = sys.exc_info()[1]
+        except Exception as err:
+            # abort the request
             if _debug: IOChainMixIn._exception("    - encoding exception: %r", err)
 
             iocb.abort(err)
@@ -295,9 +492,8 @@ class IOChainMixIn(DebugContents):
             self.Decode()
 
             if _debug: IOChainMixIn._debug("    - decode complete")
-        except:
-            # extract the error and abort
-            err = sys.exc_info()[1]
+        except Exception as err:
+            # abort the chained request
             if _debug: IOChainMixIn._exception("    - decoding exception: %r", err)
 
             iocb.ioState = ABORTED
@@ -363,6 +559,8 @@ class IOChainMixIn(DebugContents):
 
 class IOChain(IOCB, IOChainMixIn):
 
+    __slots__ = ('ioChain',)
+
     def __init__(self, chain, *args, **kwargs):
         """Initialize a chained control block."""
         if _debug: IOChain._debug("__init__ %r %r %r", chain, args, kwargs)
@@ -378,6 +576,8 @@ class IOChain(IOCB, IOChainMixIn):
 @bacpypes_debugging
 class IOGroup(IOCB, DebugContents):
 
+    __slots__ = ('ioMembers', 'ioOutstanding')
+
     _debugContents = ('ioMembers',)
 
     def __init__(self):
@@ -385,8 +585,9 @@ class IOGroup(IOCB, DebugContents):
         if _debug: IOGroup._debug("__init__")
         IOCB.__init__(self)
 
-        # start with an empty list of members
+        # start with an empty list of members, none of them outstanding
         self.ioMembers = []
+        self.ioOutstanding = set()
 
         # start out being done.  When an IOCB is added to the 
         # group that is not already completed, this state will 
@@ -398,8 +599,9 @@ class IOGroup(IOCB, DebugContents):
         """Add an IOCB to the group, you can also add other groups."""
         if _debug: IOGroup._debug("Add %r", iocb)
 
-        # add this to our members
+        # add this to our members, it is outstanding until its callback
         self.ioMembers.append(iocb)
+        self.ioOutstanding.add(iocb)
 
         # assume all of our members have not completed yet
         self.ioState = PENDING
@@ -413,11 +615,17 @@ class IOGroup(IOCB, DebugContents):
         """Callback when a child iocb completes."""
         if _debug: IOGroup._debug("group_callback %r", iocb)
 
-        # check all the members
-        for iocb in self.ioMembers:
-            if not iocb.ioComplete.isSet():
-                if _debug: IOGroup._debug("    - waiting for child: %r", iocb)
-                break
+        # a member calls back again when another callback is added to it
+        # after it has completed, it only counts the first time
+        ioOutstanding = self.ioOutstanding
+        if iocb not in ioOutstanding:
+            if _debug: IOGroup._debug("    - already complete")
+            return
+
+        # one less to wait for
+        ioOutstanding.remove(iocb)
+        if ioOutstanding:
+            if _debug: IOGroup._debug("    - waiting for %d children", len(ioOutstanding))
         else:
             if _debug: IOGroup._debug("    - all children complete")
             # everything complete
@@ -448,12 +656,20 @@ class IOGroup(IOCB, DebugContents):
 @bacpypes_debugging
 class IOQueue:
 
+    __slots__ = ('queue', 'count', 'sequence', 'notempty')
+
     def __init__(self, name):
         if _debug: IOQueue._debug("__init__ %r", name)
 
+        # heap of [priority, sequence, iocb], the sequence number keeps
+        # requests at the same priority in order and the iocb's are
+        # never compared, a removed request leaves its entry behind with
+        # the iocb replaced by None
         self.queue = []
+        self.count = 0
+        self.sequence = itertools.count()
+
         self.notempty = threading.Event()
-        self.notempty.clear()
 
     def put(self, iocb):
         """Add an IOCB to a queue.  This is usually called by the function
@@ -466,18 +682,21 @@ class IOQueue:
             raise RuntimeError("invalid state transition")
 
         # save that it might have been empty
-        wasempty = not self.notempty.isSet()
+        wasempty = not self.count
 
-        # add the request to the end of the list of iocb's at same priority
-        priority = iocb.ioPriority
-        item = (priority, iocb)
-        self.queue.insert(bisect_left(self.queue, (priority+1,)), item)
+        # add the request after the iocb's at the same priority
+        entry = [iocb.ioPriority, next(self.sequence), iocb]
+        heappush(self.queue, entry)
+        self.count += 1
 
-        # point the iocb back to this queue
+        # point the iocb back to this queue and its entry
         iocb.ioQueue = self
+        iocb.ioQueueEntry = entry
 
-        # set the event, queue is no longer empty
-        self.notempty.set()
+        # set the event when the queue is no longer empty, waiters only
+        # need to hear about the transition
+        if wasempty:
+            self.notempty.set()
 
         return wasempty
 
@@ -487,26 +706,28 @@ class IOQueue:
         if _debug: IOQueue._debug("get block=%r delay=%r", block, delay)
 
         # if the queue is empty and we do not block return None
-        if not block and not self.notempty.isSet():
+        if not block and not self.count:
             return None
 
         # wait for something to be in the queue
         if delay:
             self.notempty.wait(delay)
-            if not self.notempty.isSet():
+            if not self.count:
                 return None
         else:
             self.notempty.wait()
 
-        # extract the first element
-        priority, iocb = self.queue[0]
-        del self.queue[0]
-        iocb.ioQueue = None
+        # extract the first element, skipping the ones that were removed
+        while True:
+            priority, sequence, iocb = heappop(self.queue)
+            if iocb is not None:
+                break
+        iocb.ioQueue = iocb.ioQueueEntry = None
+        self.count -= 1
 
         # if the queue is empty, clear the event
-        qlen = len(self.queue)
-        if not qlen:
-            self.notempty.clear()
+        if not self.count:
+            self._empty()
 
         # return the request
         return iocb
@@ -516,38 +737,39 @@ class IOQueue:
         is canceled/aborted."""
         if _debug: IOQueue._debug("remove %r", iocb)
 
-        # remove the request from the queue
-        for i, item in enumerate(self.queue):
-            if iocb is item[1]:
-                if _debug: IOQueue._debug("    - found at %d", i)
-                del self.queue[i]
+        if iocb.ioQueue is not self:
+            if _debug: IOQueue._debug("    - not found")
+            return
 
-                # if the queue is empty, clear the event
-                qlen = len(self.queue)
-                if not qlen:
-                    self.notempty.clear()
+        # leave the entry in the heap without the iocb, get() will skip
+        # over it
+        iocb.ioQueueEntry[2] = None
+        iocb.ioQueue = iocb.ioQueueEntry = None
+        self.count -= 1
 
-                break
-        else:
-            if _debug: IOQueue._debug("    - not found")
+        # if the queue is empty, clear the event
+        if not self.count:
+            self._empty()
 
     def abort(self, err):
         """abort all of the control blocks in the queue."""
         if _debug: IOQueue._debug("abort %r", err)
 
-        # send aborts to all of the members
-        try:
-            for iocb in self.queue:
-                iocb.ioQueue = None
-                iocb.abort(err)
+        # take the contents, the queue is now empty
+        queue = self.queue
+        self._empty()
 
-            # flush the queue
-            self.queue = []
+        # send aborts to all of the members in order
+        for priority, sequence, iocb in sorted(queue):
+            if iocb is not None:
+                iocb.ioQueue = iocb.ioQueueEntry = None
+                iocb.abort(err)
 
-            # the queue is now empty, clear the event
-            self.notempty.clear()
-        except ValueError:
-            pass
+    def _empty(self):
+        """Forget the removed entries and clear the event."""
+        self.queue = []
+        self.count = 0
+        self.notempty.clear()
 
 #
 #   IOController
@@ -556,6 +778,8 @@ class IOQueue:
 @bacpypes_debugging
 class IOController:
 
+    __slots__ = ('name',)
+
     def __init__(self, name=None):
         """Initialize a controller."""
         if _debug: IOController._debug("__init__ name=%r", name)
@@ -565,9 +789,7 @@ class IOController:
 
         # register the name
         if name is not None:
-            if name in _local_controllers:
-                raise RuntimeError("already a local controller called '%s': %r" % (name, _local_controllers[name]))
-            _local_controllers[name] = self
+            register_controller(self)
 
     def abort(self, err):
         """Abort all requests, no default implementation."""
@@ -581,20 +803,13 @@ class IOController:
         iocb.ioController = self
 
         try:
-            # hopefully there won't be an error
-            err = None
-
             # change the state
             iocb.ioState = PENDING
 
             # let derived class figure out how to process this
             self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
-
-        # if there was an error, abort the request
-        if err:
+        except Exception as err:
+            # there was an error, abort the request
             self.abort_io(iocb, err)
 
     def process_io(self, iocb):
@@ -618,12 +833,9 @@ class IOController:
         """Called by a handler to return data to the client."""
         if _debug: IOController._debug("complete_io %r %r", iocb, msg)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
-            pass
-
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
         else:
@@ -638,12 +850,9 @@ class IOController:
         """Called by a handler or a client to abort a transaction."""
         if _debug: IOController._debug("abort_io %r %r", iocb, err)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
-            pass
-
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
         else:
@@ -661,6 +870,8 @@ class IOController:
 @bacpypes_debugging
 class IOQController(IOController):
 
+    __slots__ = ('state', 'active_iocb', 'ioQueue')
+
     wait_time = 0.0
 
     def __init__(self, name=None):
@@ -721,17 +932,10 @@ class IOQController(IOController):
             return
 
         try:
-            # hopefully there won't be an error
-            err = None
-
             # let derived class figure out how to process this
             self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
-
-        # if there was an error, abort the request
-        if err:
+        except Exception as err:
+            # there was an error, abort the request
             self.abort_io(iocb, err)
 
     def process_io(self, iocb):
@@ -761,10 +965,8 @@ class IOQController(IOController):
         if iocb is not self.active_iocb:
             raise RuntimeError("not the current iocb")
 
-        # normal completion
-        IOController.complete_io(self, iocb, msg)
-
-        # no longer an active iocb
+        # no longer an active iocb, the controller is done with it before
+        # the callbacks can submit more work
         self.active_iocb = None
 
         # check to see if we should wait a bit
@@ -783,6 +985,9 @@ class IOQController(IOController):
             # look for more to do
             deferred(IOQController._trigger, self)
 
+        # normal completion
+        IOController.complete_io(self, iocb, msg)
+
     def abort_io(self, iocb, err):
         """Called by a handler or a client to abort a transaction."""
         if _debug: IOQController._debug("abort_io %r %r", iocb, err)
@@ -808,36 +1013,26 @@ class IOQController(IOController):
         """Called to launch the next request in the queue."""
         if _debug: IOQController._debug("_trigger")
 
-        # if we are busy, do nothing
-        if self.state != CTRL_IDLE:
-            if _debug: IOQController._debug("    - not idle")
-            return
-
-        # if there is nothing to do, return
-        if not self.ioQueue.queue:
-            if _debug: IOQController._debug("    - empty queue")
-            return
-
-        # get the next iocb
-        iocb = self.ioQueue.get()
-
-        try:
-            # hopefully there won't be an error
-            err = None
-
-            # let derived class figure out how to process this
-            self.process_io(iocb)
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
+        # keep going while we are idle and there is something to do,
+        # requests that complete right away do not need another pass
+        # through the core loop
+        while (self.state == CTRL_IDLE) and self.ioQueue.queue:
+            # get the next iocb
+            iocb = self.ioQueue.get()
+            if _debug: IOQController._debug("    - iocb: %r", iocb)
 
-        # if there was an error, abort the request
-        if err:
-            self.abort_io(iocb, err)
+            try:
+                # let derived class figure out how to process this
+                self.process_io(iocb)
+            except Exception as err:
+                # there was an error, abort the request
+                self.abort_io(iocb, err)
 
-        # if we're idle, call again
-        if self.state == CTRL_IDLE:
-            deferred(IOQController._trigger, self)
+        if _debug:
+            if self.state != CTRL_IDLE:
+                IOQController._debug("    - not idle")
+            else:
+                IOQController._debug("    - empty queue")
 
     def _wait_trigger(self):
         """Called to launch the next request in the queue."""
@@ -853,6 +1048,55 @@ class IOQController(IOController):
         # look for more to do
         IOQController._trigger(self)
 
+#
+#   ShardedIOQController
+#
+
+@bacpypes_debugging
+class ShardedIOQController(IOController):
+
+    __slots__ = ('shards',)
+
+    def __init__(self, shard_class, name=None, shards=None):
+        """Initialize a controller that spreads requests across a set of
+        queue controllers, so a slow destination only holds up the requests
+        that hash to the same shard."""
+        if _debug: ShardedIOQController._debug("__init__ %r name=%r shards=%r", shard_class, name, shards)
+
+        # make sure it's the correct class
+        if not issubclass(shard_class, IOQController):
+            raise TypeError("shard class must be a subclass of IOQController")
+
+        # give ourselves a nice name
+        if not name:
+            name = self.__class__.__name__
+        IOController.__init__(self, name)
+
+        # default to one per processor
+        if not shards:
+            shards = os.cpu_count() or 1
+
+        # each shard has its own queue and state
+        self.shards = [shard_class("%s/%d" % (name, i)) for i in range(shards)]
+
+    def abort(self, err):
+        """Abort all pending requests in all of the shards."""
+        if _debug: ShardedIOQController._debug("abort %r", err)
+
+        for shard in self.shards:
+            shard.abort(err)
+
+    def request_io(self, iocb):
+        """Called by a client to start processing a request, the shard
+        is picked by the destination keyword argument of the request."""
+        if _debug: ShardedIOQController._debug("request_io %r", iocb)
+
+        shard = self.shards[hash(iocb.kwargs.get('destination')) % len(self.shards)]
+        if _debug: ShardedIOQController._debug("    - shard: %r", shard.name)
+
+        # the shard becomes the controller of the iocb
+        shard.request_io(iocb)
+
 #
 #   IOProxy
 #
@@ -860,6 +1104,8 @@ class IOQController(IOController):
 @bacpypes_debugging
 class IOProxy:
 
+    __slots__ = ('ioControllerRef', 'ioServerRef', 'ioRequestLimit', 'ioPending', 'ioBlocked', 'ioBind')
+
     def __init__(self, controllerName, serverName=None, requestLimit=None):
         """Create an IO client.  It implements request_io like a controller, but
         passes requests on to a local controller if it happens to be in the 
@@ -889,7 +1135,6 @@ class IOProxy:
     def request_io(self, iocb, urgent=False):
         """Called by a client to start processing a request."""
         if _debug: IOProxy._debug("request_io %r urgent=%r", iocb, urgent)
-        global _proxy_server
 
         # save the server and controller reference
         iocb.ioServerRef = self.ioServerRef
@@ -905,10 +1150,7 @@ class IOProxy:
                     return
                 if _debug: IOProxy._debug("    - local bind successful")
             else:
-                if not _proxy_server:
-                    _proxy_server = IOProxyServer()
-
-                self.ioBind = _proxy_server
+                self.ioBind = get_proxy_server()
                 if _debug: IOProxy._debug("    - proxy bind successful: %r", self.ioBind)
 
         # if this isn't urgent and there is a limit, see if we've reached it
@@ -936,19 +1178,27 @@ class IOProxy:
         and see if it's OK to start up the next one."""
         if _debug: IOProxy._debug("_proxy_trigger %r", iocb)
 
-        if iocb not in self.ioPending:
-            if _debug: IOProxy._warning("iocb not pending: %r", iocb)
-        else:
+        # one hash probe rather than a membership test and a remove
+        try:
             self.ioPending.remove(iocb)
+        except KeyError:
+            if _debug: IOProxy._warning("iocb not pending: %r", iocb)
+            return
 
-            # check to send another one
-            if (len(self.ioPending) < self.ioRequestLimit) and self.ioBlocked:
-                nextio = self.ioBlocked.popleft()
-                if _debug: IOProxy._debug("    - cleared for launch: %r", nextio)
-
-                # this one is now pending
-                self.ioPending.add(nextio)
-                self.ioBind.request_io(nextio)
+        # check to send another one, skipping those that were aborted
+        # while they were waiting
+        ioBlocked = self.ioBlocked
+        while ioBlocked and (len(self.ioPending) < self.ioRequestLimit):
+            nextio = ioBlocked.popleft()
+            if nextio.ioState >= COMPLETED:
+                if _debug: IOProxy._debug("    - already finished: %r", nextio)
+                continue
+            if _debug: IOProxy._debug("    - cleared for launch: %r", nextio)
+
+            # this one is now pending
+            self.ioPending.add(nextio)
+            self.ioBind.request_io(nextio)
+            break
 
 #
 #   IOServer
@@ -969,9 +1219,17 @@ class IOServer(IOController, Client):
         self.server = UDPDirector(addr)
         bind(self, self.server)
 
-        # dictionary of IOCBs as a server
+        # dictionary of IOCBs as a server, the key is the local IOCB
+        # identifier and the value is (iocb, clientID, clientAddr)
         self.remoteIOCB = {}
 
+        # the same IOCBs keyed by (clientAddr, clientID) to find the ones
+        # the clients abort
+        self.clientIOCB = {}
+
+        # message handlers indexed by opcode
+        self.messageHandlers = (self.new_iocb, None, self.abort_iocb, None)
+
     def confirmation(self, pdu):
         if _debug: IOServer._debug('confirmation %r', pdu)
 
@@ -980,19 +1238,15 @@ class IOServer(IOController, Client):
 
         try:
             # parse the request
-            request = cPickle.loads(request)
-            if _debug: _commlog.debug(">>> %s: S %s %r" % (_strftime(), str(addr), request))
+            opcode, iocbid, fields = _decode(request)
+            if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug(">>> %s: S %s %r", _strftime(), addr, (opcode, iocbid) + fields)
 
             # pick the message
-            if (request[0] == 0):
-                self.new_iocb(addr, *request[1:])
-            elif (request[0] == 1):
-                self.complete_iocb(addr, *request[1:])
-            elif (request[0] == 2):
-                self.abort_iocb(addr, *request[1:])
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
+            handler = self.messageHandlers[opcode]
+            if handler is None:
+                raise RuntimeError("unexpected opcode %r" % (opcode,))
+            handler(addr, iocbid, *fields)
+        except Exception as err:
             IOServer._exception("error %r processing %r from %r", err, request, addr)
 
     def callback(self, iocb):
@@ -1001,27 +1255,24 @@ class IOServer(IOController, Client):
         if _debug: IOServer._debug("callback %r", iocb)
 
         # make sure it's one of ours
-        if not self.remoteIOCB.has_key(iocb):
+        if iocb.ioID not in self.remoteIOCB:
             IOServer._warning("IOCB not owned by server: %r", iocb)
             return
 
-        # get the client information
-        clientID, clientAddr = self.remoteIOCB[iocb]
-
-        # we're done with this
-        del self.remoteIOCB[iocb]
+        # get the client information, we're done with this
+        _, clientID, clientAddr = self.remoteIOCB.pop(iocb.ioID)
+        del self.clientIOCB[(clientAddr, clientID)]
 
         # build a response
         if iocb.ioState == COMPLETED:
-            response = (1, clientID, iocb.ioResponse)
+            opcode, value = COMPLETE_IOCB, iocb.ioResponse
         elif iocb.ioState == ABORTED:
-            response = (2, clientID, iocb.ioError)
+            opcode, value = ABORT_IOCB, iocb.ioError
         else:
             raise RuntimeError("IOCB invalid state")
+        if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug("<<< %s: S %s %r", _strftime(), clientAddr, (opcode, clientID, value))
 
-        if _debug: _commlog.debug("<<< %s: S %s %r" % (_strftime(), clientAddr, response))
-
-        response = cPickle.dumps( response, 1 )
+        response = _encode(opcode, clientID, value)
 
         # send it to the client
         self.request(PDU(response, destination=clientAddr))
@@ -1030,36 +1281,68 @@ class IOServer(IOController, Client):
         """Called by a local application to abort all transactions."""
         if _debug: IOServer._debug("abort %r", err)
 
-        for iocb in self.remoteIOCB.keys():
-            self.abort_io(iocb, err)
+        # take all of the requests at once, nothing can find them now
+        remoteIOCB = self.remoteIOCB
+        self.remoteIOCB = {}
+        self.clientIOCB = {}
+
+        # collect the client identifiers for each client
+        aborting = []
+        clients = {}
+        for iocb, clientID, clientAddr in remoteIOCB.values():
+            # if it has already completed or aborted, leave it alone
+            if iocb.ioState >= COMPLETED:
+                continue
+            aborting.append(iocb)
+
+            clientIDs = clients.get(clientAddr)
+            if clientIDs is None:
+                clients[clientAddr] = clientIDs = []
+            clientIDs.append(clientID)
+
+            # clear the callback, the client will be told
+            iocb.ioCallback = None
+
+        # send each client its aborts in as few messages as possible
+        for clientAddr, clientIDs in clients.items():
+            for i in range(0, len(clientIDs), _bulkAbortLimit):
+                chunk = clientIDs[i:i + _bulkAbortLimit]
+                if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug("<<< %s: S %s %r", _strftime(), clientAddr, (BULK_ABORT_IOCB, 0, chunk, err))
+
+                response = _encode(BULK_ABORT_IOCB, 0, chunk, err)
+                self.request(PDU(response, destination=clientAddr))
+
+        for iocb in aborting:
+            # change the state
+            iocb.ioState = ABORTED
+            iocb.ioError = err
+
+            # notify the local controller
+            iocb.trigger()
 
     def abort_io(self, iocb, err):
         """Called by a local client or a local controlled to abort a transaction."""
         if _debug: IOServer._debug("abort_io %r %r", iocb, err)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
-            pass
-
-        elif self.remoteIOCB.has_key(iocb):
-            # get the client information
-            clientID, clientAddr = self.remoteIOCB[iocb]
-
-            # we're done with this
-            del self.remoteIOCB[iocb]
+        elif iocb.ioID in self.remoteIOCB:
+            # get the client information, we're done with this
+            _, clientID, clientAddr = self.remoteIOCB.pop(iocb.ioID)
+            del self.clientIOCB[(clientAddr, clientID)]
 
             # build an abort response
-            response = (2, clientID, err)
-            if _debug: _commlog.debug("<<< %s: S %s %r" % (_strftime(), clientAddr, response))
-
-            response = cPickle.dumps( response, 1 )
+            if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug("<<< %s: S %s %r", _strftime(), clientAddr, (ABORT_IOCB, clientID, err))
+            response = _encode(ABORT_IOCB, clientID, err)
 
             # send it to the client
-            self.socket.sendto( response, clientAddr )
+            self.request(PDU(response, destination=clientAddr))
+
+            # clear the callback, the client has been told
+            iocb.ioCallback = None
 
         else:
             IOServer._error("no reference to aborting iocb: %r", iocb)
@@ -1075,54 +1358,52 @@ class IOServer(IOController, Client):
         """Called when the server receives a new request."""
         if _debug: IOServer._debug("new_iocb %r %r %r %r %r", clientAddr, iocbid, controllerName, args, kwargs)
 
-        # look for a controller
+        # look for a controller, reject the request before anything is built
         controller = _local_controllers.get(controllerName, None)
-        if not controller:
-            # create a nice error message
-            err = RuntimeError("no local controller '%s'" % (controllerName, ))
-
-            # build an abort response
-            response = (2, iocbid, err)
-            if _debug: _commlog.debug("<<< %s: S %s %r" % (_strftime(), clientAddr, response))
-
-            response = cPickle.dumps( response, 1 )
+        if controller is None:
+            # build an abort response, the error is the same every time
+            err, data = _encode_no_controller(controllerName)
+            if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug("<<< %s: S %s %r", _strftime(), clientAddr, (ABORT_IOCB, iocbid, err))
+            response = _messageHeader.pack(_messageVersion, ABORT_IOCB, iocbid) + data
 
             # send it to the server
             self.request(PDU(response, destination=clientAddr))
+            return
 
-        else:
-            # create an IOCB
-            iocb = IOCB(*args, **kwargs)
-            if _debug: IOServer._debug("    - local IOCB %r bound to remote %r", iocb.ioID, iocbid)
+        # a retransmitted request is already being worked on
+        if (clientAddr, iocbid) in self.clientIOCB:
+            if _debug: IOServer._debug("    - duplicate request")
+            return
 
-            # save a reference to it
-            self.remoteIOCB[iocb] = (iocbid, clientAddr)
+        # create an IOCB
+        iocb = IOCB(*args, **kwargs)
+        if _debug: IOServer._debug("    - local IOCB %r bound to remote %r", iocb.ioID, iocbid)
+
+        # save a reference to it
+        self.remoteIOCB[iocb.ioID] = (iocb, iocbid, clientAddr)
+        self.clientIOCB[(clientAddr, iocbid)] = iocb
 
-            # make sure we're notified when it completes
-            iocb.add_callback(self.callback)
+        # make sure we're notified when it completes
+        iocb.add_callback(self.callback)
 
-            # pass it along
-            controller.request_io(iocb)
+        # pass it along
+        controller.request_io(iocb)
 
     def abort_iocb(self, addr, iocbid, err):
         """Called when the client or server receives an abort request."""
         if _debug: IOServer._debug("abort_iocb %r %r %r", addr, iocbid, err)
 
-        # see if this came from a client
-        for iocb in self.remoteIOCB.keys():
-            clientID, clientAddr = self.remoteIOCB[iocb]
-            if (addr == clientAddr) and (clientID == iocbid):
-                break
-        else:
+        # see if this came from a client, we're done with it
+        iocb = self.clientIOCB.pop((addr, iocbid), None)
+        if iocb is None:
             IOServer._error("no reference to aborting iocb %r from %r", iocbid, addr)
             return
         if _debug: IOServer._debug("    - local IOCB %r bound to remote %r", iocb.ioID, iocbid)
 
-        # we're done with this
-        del self.remoteIOCB[iocb]
+        del self.remoteIOCB[iocb.ioID]
 
         # clear the callback, we already know
-        iocb.ioCallback = []
+        iocb.ioCallback = None
 
         # tell the local controller about the abort
         iocb.abort(err)
@@ -1144,11 +1425,14 @@ class IOProxyServer(IOController, Client):
         # create a UDP director
         self.server = UDPDirector(addr)
         bind(self, self.server)
-        if _debug: IOProxyServer._debug("    - bound to %r", self.server.socket.getsockname())
+        if _debug: IOProxyServer._debug("    - bound to %r", self.server.transport.get_extra_info('sockname'))
 
         # dictionary of IOCBs as a client
         self.localIOCB = {}
 
+        # message handlers indexed by opcode
+        self.messageHandlers = (None, self.complete_iocb, self.abort_iocb, self.bulk_abort_iocb)
+
     def confirmation(self, pdu):
         if _debug: IOProxyServer._debug('confirmation %r', pdu)
 
@@ -1157,17 +1441,15 @@ class IOProxyServer(IOController, Client):
 
         try:
             # parse the request
-            request = cPickle.loads(request)
-            if _debug: _commlog.debug(">>> %s: P %s %r" % (_strftime(), addr, request))
+            opcode, iocbid, fields = _decode(request)
+            if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug(">>> %s: P %s %r", _strftime(), addr, (opcode, iocbid) + fields)
 
             # pick the message
-            if (request[0] == 1):
-                self.complete_iocb(addr, *request[1:])
-            elif (request[0] == 2):
-                self.abort_iocb(addr, *request[1:])
-        except:
-            # extract the error
-            err = sys.exc_info()[1]
+            handler = self.messageHandlers[opcode]
+            if handler is None:
+                raise RuntimeError("unexpected opcode %r" % (opcode,))
+            handler(addr, iocbid, *fields)
+        except Exception as err:
             IOProxyServer._exception("error %r processing %r from %r", err, request, addr)
 
     def process_io(self, iocb):
@@ -1182,10 +1464,10 @@ class IOProxyServer(IOController, Client):
             iocb.set_timeout( SERVER_TIMEOUT, RuntimeError("no response from " + iocb.ioServerRef))
 
         # build a message
-        request = (0, iocb.ioID, iocb.ioControllerRef, iocb.args, iocb.kwargs)
-        if _debug: _commlog.debug("<<< %s: P %s %r" % (_strftime(), iocb.ioServerRef, request))
-
-        request = cPickle.dumps( request, 1 )
+        if _commlog.isEnabledFor(logging.DEBUG):
+            _commlog.debug("<<< %s: P %s %r", _strftime(), iocb.ioServerRef,
+                (NEW_IOCB, iocb.ioID, iocb.ioControllerRef, iocb.args, iocb.kwargs))
+        request = _encode(NEW_IOCB, iocb.ioID, iocb.ioControllerRef, iocb.args, iocb.kwargs)
 
         # send it to the server
         self.request(PDU(request, destination=(iocb.ioServerRef, PORT)))
@@ -1195,30 +1477,28 @@ class IOProxyServer(IOController, Client):
         and remote."""
         if _debug: IOProxyServer._debug("abort %r", err)
 
-        for iocb in self.localIOCB.values():
+        # abort_io() deletes from the dictionary, so work from a list of
+        # the ones that are still outstanding
+        pending = [iocb for iocb in self.localIOCB.values() if iocb.ioState < COMPLETED]
+        for iocb in pending:
             self.abort_io(iocb, err)
 
     def abort_io(self, iocb, err):
         """Called by a local client or a local controlled to abort a transaction."""
         if _debug: IOProxyServer._debug("abort_io %r %r", iocb, err)
 
-        # if it completed, leave it alone
-        if iocb.ioState == COMPLETED:
-            pass
-
-        # if it already aborted, leave it alone
-        elif iocb.ioState == ABORTED:
+        # if it has already completed or aborted, leave it alone, they
+        # are the last two states
+        if iocb.ioState >= COMPLETED:
             pass
 
-        elif self.localIOCB.has_key(iocb.ioID):
+        elif iocb.ioID in self.localIOCB:
             # delete the dictionary reference
             del self.localIOCB[iocb.ioID]
 
             # build an abort request
-            request = (2, iocb.ioID, err)
-            if _debug: _commlog.debug("<<< %s: P %s %r" % (_strftime(), iocb.ioServerRef, request))
-
-            request = cPickle.dumps( request, 1 )
+            if _commlog.isEnabledFor(logging.DEBUG): _commlog.debug("<<< %s: P %s %r", _strftime(), iocb.ioServerRef, (ABORT_IOCB, iocb.ioID, err))
+            request = _encode(ABORT_IOCB, iocb.ioID, err)
 
             # send it to the server
             self.request(PDU(request, destination=(iocb.ioServerRef, PORT)))
@@ -1241,15 +1521,12 @@ class IOProxyServer(IOController, Client):
         iocb = None
 
         # make sure this is a local request
-        if not self.localIOCB.has_key(iocbid):
+        if iocbid not in self.localIOCB:
             IOProxyServer._error("no reference to IOCB %r", iocbid)
             if _debug: IOProxyServer._debug("    - localIOCB: %r", self.localIOCB)
         else:
-            # get the iocb
-            iocb = self.localIOCB[iocbid]
-
-            # delete the dictionary reference
-            del self.localIOCB[iocbid]
+            # get the iocb and delete the dictionary reference
+            iocb = self.localIOCB.pop(iocbid)
 
         if iocb:
             # change the state
@@ -1259,18 +1536,34 @@ class IOProxyServer(IOController, Client):
             # notify the client
             iocb.trigger()
 
+    def bulk_abort_iocb(self, addr, iocbid, iocbids, err):
+        """Called when the client receives the aborts for a list of requests,
+        the server is aborting everything."""
+        if _debug: IOProxyServer._debug("bulk_abort_iocb %r %r %r", addr, iocbids, err)
+
+        for iocbid in iocbids:
+            # get the iocb and delete the dictionary reference
+            iocb = self.localIOCB.pop(iocbid, None)
+            if not iocb:
+                IOProxyServer._error("no reference to aborting iocb: %r", iocbid)
+                continue
+
+            # change the state
+            iocb.ioState = ABORTED
+            iocb.ioError = err
+
+            # notify the client
+            iocb.trigger()
+
     def abort_iocb(self, addr, iocbid, err):
         """Called when the client or server receives an abort request."""
         if _debug: IOProxyServer._debug("abort_iocb %r %r %r", addr, iocbid, err)
 
-        if not self.localIOCB.has_key(iocbid):
+        if iocbid not in self.localIOCB:
             raise RuntimeError("no reference to aborting iocb: %r" % (iocbid,))
 
-        # get the iocb
-        iocb = self.localIOCB[iocbid]
-
-        # delete the dictionary reference
-        del self.localIOCB[iocbid]
+        # get the iocb and delete the dictionary reference
+        iocb = self.localIOCB.pop(iocbid)
 
         # change the state
         iocb.ioState = ABORTED
@@ -1279,6 +1572,44 @@ class IOProxyServer(IOController, Client):
         # notify the client
         iocb.trigger()
 
+#
+#   register_controller
+#
+
+@bacpypes_debugging
+def register_controller(controller):
+    """Add a controller to the local controllers.  The new mapping is
+    published in one assignment so readers never need the lock."""
+    if _debug: register_controller._debug("register_controller %r", controller)
+    global _local_controllers
+
+    with _local_controllers_lock:
+        name = controller.name
+        if name in _local_controllers:
+            raise RuntimeError("already a local controller called '%s': %r" % (name, _local_controllers[name]))
+
+        controllers = dict(_local_controllers)
+        controllers[name] = controller
+        _local_controllers = types.MappingProxyType(controllers)
+
+#
+#   get_proxy_server
+#
+
+@bacpypes_debugging
+def get_proxy_server():
+    """Return the proxy server, creating it the first time it is needed."""
+    if _debug: get_proxy_server._debug("get_proxy_server")
+    global _proxy_server
+
+    if _proxy_server is None:
+        with _proxy_server_lock:
+            # check again, another thread may have beaten us to it
+            if _proxy_server is None:
+                _proxy_server = IOProxyServer()
+
+    return _proxy_server
+
 #
 #   abort
 #
@@ -11,8 +11,8 @@ except ImportError:
     from distutils.core import setup
 
 # ensure supported Python version
-if sys.version_info < (3, 7):
-    raise EnvironmentError("BACpypes requires Python 3.7 or newer")
+if sys.version_info < (3, 11):
+    raise EnvironmentError("BACpypes requires Python 3.11 or newer")
 
 # single source directory
 source_folder = 'py34'
@@ -64,13 +64,9 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.7',
-        'Programming Language :: Python :: 3.8',
-        'Programming Language :: Python :: 3.9',
-        'Programming Language :: Python :: 3.10',
         'Programming Language :: Python :: 3.11',
     ],
-    python_requires='>=3.7',
+    python_requires='>=3.11',
 
     setup_requires=setup_requirements,
 
@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+"""
+Test BACpypes Event Module
+"""
+
+from . import test_waitable_event
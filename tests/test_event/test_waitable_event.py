@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test WaitableEvent
+------------------
+"""
+
+import os
+import gc
+import asyncio
+import threading
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes import event
+from bacpypes.event import WaitableEvent
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+def pipe_is_empty(evt):
+    """Return true if there is nothing to read from the event pipe."""
+    try:
+        os.read(evt.fileno(), 1)
+    except BlockingIOError:
+        return True
+    return False
+
+
+def open_fds():
+    """Return the number of open file descriptors of this process."""
+    return len(os.listdir('/proc/self/fd'))
+
+
+@bacpypes_debugging
+class TestWaitableEvent(unittest.TestCase):
+
+    def test_set_clear_wait(self):
+        if _debug: TestWaitableEvent._debug("test_set_clear_wait")
+
+        evt = WaitableEvent()
+        assert not evt.is_set()
+        assert not evt.wait(0)
+
+        # setting it makes the pipe readable
+        evt.set()
+        assert evt.is_set()
+        assert evt.wait(0)
+        assert not pipe_is_empty(evt)
+
+        # clearing it drains the pipe
+        evt.set()
+        evt.clear()
+        assert not evt.is_set()
+        assert pipe_is_empty(evt)
+
+        # set from another thread
+        timer = threading.Timer(0.05, evt.set)
+        timer.start()
+        assert evt.wait(5.0)
+        timer.join()
+
+        evt.close()
+
+    def test_asyncio_loop(self):
+        if _debug: TestWaitableEvent._debug("test_asyncio_loop")
+
+        loop = asyncio.new_event_loop()
+        try:
+            evt = WaitableEvent(loop)
+
+            # the loop drains the pipe and the event stays set
+            evt.set()
+            loop.run_until_complete(asyncio.sleep(0.01))
+            assert evt.is_set()
+            assert pipe_is_empty(evt)
+
+            evt.close()
+        finally:
+            loop.close()
+
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), "needs /proc/self/fd")
+    def test_fd_cleanup(self):
+        if _debug: TestWaitableEvent._debug("test_fd_cleanup")
+
+        gc.collect()
+        fds = open_fds()
+
+        # the asyncore dispatcher when there is one
+        for i in range(50):
+            WaitableEvent()
+        gc.collect()
+        assert open_fds() == fds
+
+        # an asyncio loop does not keep them alive either
+        loop = asyncio.new_event_loop()
+        try:
+            loop_fds = open_fds()
+            for i in range(50):
+                WaitableEvent(loop)
+            gc.collect()
+            assert open_fds() == loop_fds
+        finally:
+            loop.close()
+
+    def test_shared_loop(self):
+        if _debug: TestWaitableEvent._debug("test_shared_loop")
+
+        # without asyncore the events share one asyncio loop
+        saved_asyncore = event.asyncore
+        event.asyncore = None
+        try:
+            evt1 = WaitableEvent()
+            evt2 = WaitableEvent()
+            assert evt1._loop is evt2._loop
+            assert evt1._loop is event._get_event_loop()
+
+            evt1.close()
+            evt2.close()
+        finally:
+            event.asyncore = saved_asyncore
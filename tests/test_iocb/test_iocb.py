@@ -1 +1,57 @@
-# placeholder
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test IOCB
+---------
+"""
+
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes.iocb import IOCB, ABORTED, TimeoutError
+
+from ..time_machine import reset_time_machine, run_time_machine
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class TestIOCB(unittest.TestCase):
+
+    def test_timeout(self):
+        if _debug: TestIOCB._debug("test_timeout")
+
+        reset_time_machine()
+
+        iocb = IOCB()
+        iocb.set_timeout(5.0)
+        run_time_machine(10.0)
+
+        # aborted with the default error
+        assert iocb.ioState == ABORTED
+        assert iocb.ioError is TimeoutError
+
+    def test_timeout_reset(self):
+        if _debug: TestIOCB._debug("test_timeout_reset")
+
+        reset_time_machine()
+
+        # the second call reschedules the same timer with the new error
+        err = RuntimeError("later")
+        iocb = IOCB()
+        iocb.set_timeout(2.0)
+        timer = iocb.ioTimeout
+        iocb.set_timeout(5.0, err)
+        assert iocb.ioTimeout is timer
+
+        # not aborted at the first deadline
+        run_time_machine(3.0)
+        assert iocb.ioState != ABORTED
+
+        # aborted at the second one
+        run_time_machine(3.0)
+        assert iocb.ioState == ABORTED
+        assert iocb.ioError is err
@@ -1 +1,67 @@
-# placeholder
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test IOGroup
+------------
+"""
+
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes.iocb import IOCB, IOGroup, PENDING, COMPLETED
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class TestIOGroup(unittest.TestCase):
+
+    def test_group_complete(self):
+        if _debug: TestIOGroup._debug("test_group_complete")
+
+        # keep track of the group callbacks
+        callbacks = []
+
+        iocb1, iocb2 = IOCB(), IOCB()
+        group = IOGroup()
+        group.add(iocb1)
+        group.add(iocb2)
+        group.add_callback(callbacks.append)
+        assert group.ioState == PENDING
+
+        # still waiting for the second one
+        iocb1.complete(1)
+        assert group.ioState == PENDING
+        assert not callbacks
+
+        # now done
+        iocb2.complete(2)
+        assert group.ioState == COMPLETED
+        assert callbacks == [group]
+
+    def test_repeat_callback(self):
+        if _debug: TestIOGroup._debug("test_repeat_callback")
+
+        # keep track of the group callbacks
+        callbacks = []
+
+        iocb1, iocb2 = IOCB(), IOCB()
+        group = IOGroup()
+        group.add(iocb1)
+        group.add(iocb2)
+        group.add_callback(callbacks.append)
+
+        # adding a callback to a completed member calls them all again
+        iocb1.complete(1)
+        iocb1.add_callback(lambda iocb: None)
+
+        # the group is still waiting for the second one
+        assert group.ioState == PENDING
+        assert not callbacks
+
+        iocb2.complete(2)
+        assert group.ioState == COMPLETED
+        assert callbacks == [group]
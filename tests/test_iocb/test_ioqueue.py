@@ -1 +1,77 @@
-# placeholder
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test IOQueue
+------------
+"""
+
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes.iocb import IOCB, IOQueue, PENDING
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+def pending_iocb(priority=0):
+    """Return an IOCB that is ready to be queued."""
+    iocb = IOCB(_priority=priority)
+    iocb.ioState = PENDING
+    return iocb
+
+
+@bacpypes_debugging
+class TestIOQueue(unittest.TestCase):
+
+    def test_priority_order(self):
+        if _debug: TestIOQueue._debug("test_priority_order")
+
+        ioq = IOQueue("test")
+        iocbs = [pending_iocb(p) for p in (1, 0, 1, 0)]
+        for iocb in iocbs:
+            ioq.put(iocb)
+
+        # lower priority values first, in order within the same priority
+        expected = [iocbs[1], iocbs[3], iocbs[0], iocbs[2]]
+        assert [ioq.get(block=0) for _ in iocbs] == expected
+
+        # now empty
+        assert ioq.get(block=0) is None
+        assert not ioq.queue
+
+    def test_remove(self):
+        if _debug: TestIOQueue._debug("test_remove")
+
+        ioq = IOQueue("test")
+        iocb1, iocb2 = pending_iocb(), pending_iocb()
+        ioq.put(iocb1)
+        ioq.put(iocb2)
+
+        # removed requests are skipped
+        ioq.remove(iocb1)
+        assert iocb1.ioQueue is None
+        assert ioq.get(block=0) is iocb2
+
+        # removing the last one empties the queue
+        ioq.put(iocb1)
+        ioq.remove(iocb1)
+        assert not ioq.queue
+        assert ioq.get(block=0) is None
+
+    def test_remove_requeue(self):
+        if _debug: TestIOQueue._debug("test_remove_requeue")
+
+        ioq = IOQueue("test")
+        iocb1, iocb2 = pending_iocb(), pending_iocb()
+        ioq.put(iocb1)
+        ioq.put(iocb2)
+
+        # removed and queued again, it goes behind the other one
+        ioq.remove(iocb1)
+        ioq.put(iocb1)
+        assert ioq.get(block=0) is iocb2
+        assert ioq.get(block=0) is iocb1
+        assert ioq.get(block=0) is None
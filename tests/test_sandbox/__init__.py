@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+"""
+Test BACpypes Sandbox IO Module
+-------------------------------
+
+The sandbox is not a package, so sandbox/io.py is loaded from its file
+once, here, as the sandbox_io module.  Collecting these tests runs the
+module level code of the sandbox, the library tests do not import it.
+"""
+
+import os
+import importlib.util
+
+_spec = importlib.util.spec_from_file_location(
+    "sandbox_io",
+    os.path.join(os.path.dirname(__file__), "..", "..", "sandbox", "io.py"),
+    )
+sandbox_io = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sandbox_io)
+
+from . import test_messages
+from . import test_ioqcontroller
+from . import test_shardedioqcontroller
+from . import test_ioserver
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Sandbox IO Test Helpers
+-----------------------
+"""
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+
+from . import sandbox_io
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class CompletingController(sandbox_io.IOQController):
+
+    """Complete each request with its first argument as soon as it is
+    processed."""
+
+    def process_io(self, iocb):
+        if _debug: CompletingController._debug("process_io %r", iocb)
+
+        self.active_io(iocb)
+        self.complete_io(iocb, iocb.args[0] if iocb.args else None)
+
+
+@bacpypes_debugging
+class ActiveController(sandbox_io.IOQController):
+
+    """Keep each request active, it is up to the test to finish it."""
+
+    def process_io(self, iocb):
+        if _debug: ActiveController._debug("process_io %r", iocb)
+
+        self.active_io(iocb)
+
+
+@bacpypes_debugging
+class IOServer(sandbox_io.IOServer):
+
+    """An IOServer without a UDP director, the messages it sends are
+    decoded and saved."""
+
+    def __init__(self):
+        if _debug: IOServer._debug("__init__")
+        sandbox_io.IOController.__init__(self)
+
+        self.remoteIOCB = {}
+        self.clientIOCB = {}
+        self.messageHandlers = (self.new_iocb, None, self.abort_iocb, None)
+
+        # (destination, opcode, iocbid, fields) of the messages sent
+        self.sent = []
+        self.sentPDUs = []
+
+    def request(self, pdu):
+        if _debug: IOServer._debug("request %r", pdu)
+
+        opcode, iocbid, fields = sandbox_io._decode(pdu.pduData)
+        self.sent.append((pdu.pduDestination, opcode, iocbid, fields))
+        self.sentPDUs.append(pdu)
+
+
+@bacpypes_debugging
+class IOProxyServer(sandbox_io.IOProxyServer):
+
+    """An IOProxyServer without a UDP director, the messages it sends are
+    decoded and saved."""
+
+    def __init__(self):
+        if _debug: IOProxyServer._debug("__init__")
+        sandbox_io.IOController.__init__(self)
+
+        self.localIOCB = {}
+        self.messageHandlers = (None, self.complete_iocb, self.abort_iocb, self.bulk_abort_iocb)
+
+        # (destination, opcode, iocbid, fields) of the messages sent
+        self.sent = []
+
+    def request(self, pdu):
+        if _debug: IOProxyServer._debug("request %r", pdu)
+
+        opcode, iocbid, fields = sandbox_io._decode(pdu.pduData)
+        self.sent.append((pdu.pduDestination, opcode, iocbid, fields))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test Sandbox IOQController
+--------------------------
+"""
+
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+
+from ..time_machine import reset_time_machine, run_time_machine
+
+from . import sandbox_io
+from .helpers import CompletingController, ActiveController, IOServer
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class TestIOQController(unittest.TestCase):
+
+    def test_complete_now(self):
+        if _debug: TestIOQController._debug("test_complete_now")
+
+        reset_time_machine()
+
+        # keep track of the callbacks
+        callbacks = []
+
+        controller = CompletingController("test_complete_now")
+        iocb = sandbox_io.IOCB(1)
+        iocb.add_callback(callbacks.append)
+        controller.request_io(iocb)
+
+        # done before the core loop runs, waiting does not block
+        assert iocb.ioState == sandbox_io.COMPLETED
+        assert iocb.ioResponse == 1
+        assert iocb.ioComplete.is_set()
+        assert iocb.ioComplete.wait(0)
+        assert callbacks == [iocb]
+
+        # the controller is idle again
+        assert controller.state == sandbox_io.CTRL_IDLE
+        assert controller.active_iocb is None
+
+    def test_queued(self):
+        if _debug: TestIOQController._debug("test_queued")
+
+        reset_time_machine()
+
+        controller = ActiveController("test_queued")
+        iocb1, iocb2 = sandbox_io.IOCB(), sandbox_io.IOCB()
+        controller.request_io(iocb1)
+        controller.request_io(iocb2)
+        assert controller.active_iocb is iocb1
+
+        # a callback that asks for more sees an idle controller
+        states = []
+        iocb1.add_callback(lambda iocb: states.append(controller.state))
+        controller.complete_io(iocb1, 1)
+        assert states == [sandbox_io.CTRL_IDLE]
+
+        # the next one starts from the core loop
+        assert controller.active_iocb is None
+        run_time_machine(1.0)
+        assert controller.active_iocb is iocb2
+
+    def test_server_abort_after_complete(self):
+        if _debug: TestIOQController._debug("test_server_abort_after_complete")
+
+        reset_time_machine()
+
+        controller = CompletingController("test_server_abort_after_complete")
+        server = IOServer()
+
+        # the request completes inside new_iocb
+        server.new_iocb(('10.0.0.1', 8002), 7, controller.name, (2,), {})
+        assert server.sent == [(('10.0.0.1', 8002), sandbox_io.COMPLETE_IOCB, 7, (2,))]
+        assert not server.remoteIOCB
+        assert not server.clientIOCB
+
+        # nothing left to abort
+        server.abort(RuntimeError("abort"))
+        run_time_machine(1.0)
+        assert len(server.sent) == 1
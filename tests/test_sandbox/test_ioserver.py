@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test Sandbox IOServer
+---------------------
+"""
+
+import logging
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes.comm import PDU
+
+from ..time_machine import reset_time_machine, run_time_machine
+
+from . import sandbox_io
+from .helpers import ActiveController, IOServer, IOProxyServer
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class TestIOServer(unittest.TestCase):
+
+    def test_abort_io(self):
+        if _debug: TestIOServer._debug("test_abort_io")
+
+        reset_time_machine()
+
+        controller = ActiveController("test_abort_io")
+        server = IOServer()
+        err = RuntimeError("abort")
+
+        server.new_iocb(('10.0.0.1', 8002), 3, controller.name, (), {})
+        iocb = controller.active_iocb
+
+        # the client is told once and the server callback stays quiet
+        with self.assertNoLogs("sandbox_io", level="WARNING"):
+            server.abort_io(iocb, err)
+            run_time_machine(1.0)
+
+        assert iocb.ioState == sandbox_io.ABORTED
+        assert len(server.sent) == 1
+        dest, opcode, iocbid, fields = server.sent[0]
+        assert (dest, opcode, iocbid) == (('10.0.0.1', 8002), sandbox_io.ABORT_IOCB, 3)
+        assert str(fields[0]) == "abort"
+        assert not server.remoteIOCB
+        assert not server.clientIOCB
+
+    def test_bulk_abort(self):
+        if _debug: TestIOServer._debug("test_bulk_abort")
+
+        reset_time_machine()
+
+        controller = ActiveController("test_bulk_abort")
+        server = IOServer()
+        err = RuntimeError("shutdown")
+
+        # three requests from one client, two from another, one of them
+        # is active and the rest are queued
+        client1, client2 = ('10.0.0.1', 8002), ('10.0.0.2', 8002)
+        for clientAddr, iocbid in ((client1, 1), (client2, 1), (client1, 2), (client2, 2), (client1, 3)):
+            server.new_iocb(clientAddr, iocbid, controller.name, (), {})
+        iocbs = [iocb for iocb, _, _ in server.remoteIOCB.values()]
+
+        with self.assertNoLogs("sandbox_io", level="WARNING"):
+            server.abort(err)
+            run_time_machine(1.0)
+
+        # one message for each client with all of its identifiers
+        assert len(server.sent) == 2
+        messages = {}
+        for dest, opcode, iocbid, (iocbids, msgerr) in server.sent:
+            assert (opcode, iocbid) == (sandbox_io.BULK_ABORT_IOCB, 0)
+            assert str(msgerr) == "shutdown"
+            messages[dest] = sorted(iocbids)
+        assert messages == {client1: [1, 2, 3], client2: [1, 2]}
+
+        # the local requests are aborted and forgotten
+        assert all(iocb.ioState == sandbox_io.ABORTED for iocb in iocbs)
+        assert all(iocb.ioError is err for iocb in iocbs)
+        assert not server.remoteIOCB
+        assert not server.clientIOCB
+
+    def test_bulk_abort_limit(self):
+        if _debug: TestIOServer._debug("test_bulk_abort_limit")
+
+        reset_time_machine()
+
+        controller = ActiveController("test_bulk_abort_limit")
+        server = IOServer()
+
+        clientAddr = ('10.0.0.1', 8002)
+        for iocbid in range(7):
+            server.new_iocb(clientAddr, iocbid, controller.name, (), {})
+
+        # the identifiers are split at the limit
+        saved_limit = sandbox_io._bulkAbortLimit
+        sandbox_io._bulkAbortLimit = 3
+        try:
+            server.abort(RuntimeError("shutdown"))
+        finally:
+            sandbox_io._bulkAbortLimit = saved_limit
+
+        chunks = [fields[0] for dest, opcode, iocbid, fields in server.sent]
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert sorted(sum(chunks, [])) == list(range(7))
+
+    def test_bulk_abort_client(self):
+        if _debug: TestIOServer._debug("test_bulk_abort_client")
+
+        reset_time_machine()
+
+        controller = ActiveController("test_bulk_abort_client")
+        server = IOServer()
+        proxy = IOProxyServer()
+        serverAddr = ('10.0.0.9', sandbox_io.PORT)
+
+        # send the client requests to the server
+        callbacks = []
+        iocbs = []
+        for i in range(3):
+            iocb = sandbox_io.IOCB()
+            iocb.ioServerRef = serverAddr[0]
+            iocb.ioControllerRef = controller.name
+            iocb.add_callback(callbacks.append)
+            iocbs.append(iocb)
+
+            proxy.process_io(iocb)
+        for dest, opcode, iocbid, fields in proxy.sent:
+            assert dest == serverAddr
+            server.new_iocb(('10.0.0.1', 47808), iocbid, *fields)
+
+        # pass the bulk abort back to the client
+        server.abort(RuntimeError("shutdown"))
+        assert len(server.sentPDUs) == 1
+        proxy.confirmation(PDU(server.sentPDUs[0].pduData, source=serverAddr))
+
+        # each one is aborted and its callback made once
+        for iocb in iocbs:
+            assert iocb.ioState == sandbox_io.ABORTED
+            assert str(iocb.ioError) == "shutdown"
+            assert iocb.ioComplete.is_set()
+        assert callbacks == iocbs
+        assert not proxy.localIOCB
+
+    def test_no_controller(self):
+        if _debug: TestIOServer._debug("test_no_controller")
+
+        server = IOServer()
+        commlog = logging.getLogger("sandbox_io._commlog")
+
+        # the request is rejected and the log shows the error that is sent
+        with self.assertLogs(commlog, level="DEBUG") as log:
+            server.new_iocb(('10.0.0.1', 8002), 4, "test_no_controller", (), {})
+
+        assert len(server.sent) == 1
+        dest, opcode, iocbid, (err,) = server.sent[0]
+        assert (opcode, iocbid) == (sandbox_io.ABORT_IOCB, 4)
+        assert str(err) == "no local controller 'test_no_controller'"
+        assert repr(err) in log.output[0]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test Sandbox IO Messages
+------------------------
+"""
+
+import pickle
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+
+from . import sandbox_io
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+# the sandbox module is not importable by name
+_encode = sandbox_io._encode
+_decode = sandbox_io._decode
+_encode_no_controller = sandbox_io._encode_no_controller
+_messageHeader = sandbox_io._messageHeader
+_messageVersion = sandbox_io._messageVersion
+_messageBuffersVersion = sandbox_io._messageBuffersVersion
+_copyLimit = sandbox_io._copyLimit
+
+NEW_IOCB = sandbox_io.NEW_IOCB
+COMPLETE_IOCB = sandbox_io.COMPLETE_IOCB
+ABORT_IOCB = sandbox_io.ABORT_IOCB
+BULK_ABORT_IOCB = sandbox_io.BULK_ABORT_IOCB
+
+
+@bacpypes_debugging
+class TestMessages(unittest.TestCase):
+
+    def test_new_iocb(self):
+        if _debug: TestMessages._debug("test_new_iocb")
+
+        data = _encode(NEW_IOCB, 12, "ctrl", (1, "two"), {'destination': "3"})
+        assert data[0] == _messageVersion
+        assert _decode(data) == (NEW_IOCB, 12, ("ctrl", (1, "two"), {'destination': "3"}))
+
+    def test_complete_iocb(self):
+        if _debug: TestMessages._debug("test_complete_iocb")
+
+        data = _encode(COMPLETE_IOCB, 2 ** 40, [1, 2, 3])
+        assert _decode(data) == (COMPLETE_IOCB, 2 ** 40, ([1, 2, 3],))
+
+    def test_complete_none(self):
+        if _debug: TestMessages._debug("test_complete_none")
+
+        # a completion without a response is only the header
+        data = _encode(COMPLETE_IOCB, 3, None)
+        assert len(data) == _messageHeader.size
+        assert _decode(data) == (COMPLETE_IOCB, 3, (None,))
+
+    def test_abort_iocb(self):
+        if _debug: TestMessages._debug("test_abort_iocb")
+
+        opcode, iocbid, (err,) = _decode(_encode(ABORT_IOCB, 4, RuntimeError("oops")))
+        assert (opcode, iocbid) == (ABORT_IOCB, 4)
+        assert isinstance(err, RuntimeError)
+        assert str(err) == "oops"
+
+    def test_no_controller(self):
+        if _debug: TestMessages._debug("test_no_controller")
+
+        # the cached fields follow a plain header
+        err, fields = _encode_no_controller("nope")
+        assert str(err) == "no local controller 'nope'"
+        assert _encode_no_controller("nope")[0] is err
+
+        data = _messageHeader.pack(_messageVersion, ABORT_IOCB, 5) + fields
+        opcode, iocbid, (msgerr,) = _decode(data)
+        assert (opcode, iocbid) == (ABORT_IOCB, 5)
+        assert str(msgerr) == str(err)
+
+    def test_bulk_abort_iocb(self):
+        if _debug: TestMessages._debug("test_bulk_abort_iocb")
+
+        opcode, iocbid, (iocbids, err) = _decode(_encode(BULK_ABORT_IOCB, 0, [1, 2, 3], RuntimeError("all")))
+        assert (opcode, iocbid, iocbids) == (BULK_ABORT_IOCB, 0, [1, 2, 3])
+        assert str(err) == "all"
+
+    def test_large(self):
+        if _debug: TestMessages._debug("test_large")
+
+        # unpickled from a view of the message
+        value = "x" * (2 * _copyLimit)
+        data = bytearray(_encode(COMPLETE_IOCB, 6, value))
+        assert len(data) > _copyLimit
+        assert _decode(data) == (COMPLETE_IOCB, 6, (value,))
+
+    def test_buffers(self):
+        if _debug: TestMessages._debug("test_buffers")
+
+        # out-of-band buffers make it the second version
+        buffers = [bytearray(b"first"), bytearray(b"second" * 1000)]
+        data = _encode(COMPLETE_IOCB, 7, [pickle.PickleBuffer(b) for b in buffers])
+        assert data[0] == _messageBuffersVersion
+
+        opcode, iocbid, (value,) = _decode(bytearray(data))
+        assert (opcode, iocbid) == (COMPLETE_IOCB, 7)
+        assert [bytes(b) for b in value] == [bytes(b) for b in buffers]
+
+    def test_legacy(self):
+        if _debug: TestMessages._debug("test_legacy")
+
+        # a fully pickled tuple from an older peer
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            data = pickle.dumps((ABORT_IOCB, 8, "err"), protocol)
+            assert data[0] not in (_messageVersion, _messageBuffersVersion)
+            assert _decode(data) == (ABORT_IOCB, 8, ("err",))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test Sandbox ShardedIOQController
+---------------------------------
+"""
+
+import unittest
+
+from bacpypes.debugging import bacpypes_debugging, ModuleLogger
+from bacpypes.pdu import Address
+
+from . import sandbox_io
+from .helpers import ActiveController
+
+# some debugging
+_debug = 0
+_log = ModuleLogger(globals())
+
+
+@bacpypes_debugging
+class TestShardedIOQController(unittest.TestCase):
+
+    def test_shard_class(self):
+        if _debug: TestShardedIOQController._debug("test_shard_class")
+
+        # the shards have to be queue controllers
+        with self.assertRaises(TypeError):
+            sandbox_io.ShardedIOQController(sandbox_io.IOController)
+
+    def test_stable_shard(self):
+        if _debug: TestShardedIOQController._debug("test_stable_shard")
+
+        controller = sandbox_io.ShardedIOQController(ActiveController, "test_stable_shard", shards=4)
+        assert len(controller.shards) == 4
+
+        # equal destinations always end up in the same shard
+        for dest in ("1:2", "2:3", "192.168.0.1", "3:4"):
+            iocbs = [sandbox_io.IOCB(destination=Address(dest)) for _ in range(3)]
+            for iocb in iocbs:
+                controller.request_io(iocb)
+
+            shard = iocbs[0].ioController
+            assert shard in controller.shards
+            assert all(iocb.ioController is shard for iocb in iocbs)
+
+    def test_separate_shards(self):
+        if _debug: TestShardedIOQController._debug("test_separate_shards")
+
+        controller = sandbox_io.ShardedIOQController(ActiveController, "test_separate_shards", shards=2)
+
+        # the first destination is busy with one request and has another
+        # one queued behind it
+        busy1 = sandbox_io.IOCB(destination=Address("1:1"))
+        busy2 = sandbox_io.IOCB(destination=Address("1:1"))
+        controller.request_io(busy1)
+        controller.request_io(busy2)
+        busyShard = busy1.ioController
+        assert busyShard.active_iocb is busy1
+        assert busy2.ioQueue is busyShard.ioQueue
+
+        # find a destination that goes to the other shard
+        for net in range(2, 100):
+            iocb = sandbox_io.IOCB(destination=Address("%d:1" % (net,)))
+            controller.request_io(iocb)
+            if iocb.ioController is not busyShard:
+                break
+        else:
+            self.fail("every destination went to the same shard")
+
+        # it is not held up by the busy one
+        otherShard = iocb.ioController
+        assert otherShard in controller.shards
+        assert otherShard.active_iocb is iocb
+        assert iocb.ioQueue is None
+        assert iocb.ioState == sandbox_io.ACTIVE
+        assert busyShard.active_iocb is busy1